@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Кабинеты WB (группы A–F): продавец в выгрузках и API-ключ из st.secrets."""
+import streamlit as st
+
+# группа -> значение колонки 'Продавец' в выгрузках
+SELLERS = {
+    "A": "ОБЩИЙ",
+    "B": "B",
+    "C": "ОБЩИЙ",
+    "D": "ОБЩИЙ",
+    "E": "ОБЩИЙ",
+    "F": "Я ЧОРНИ",
+}
+
+ACCOUNTS = list(SELLERS)
+
+
+def api_key(account: str) -> str:
+    return st.secrets.get(f"API_{account}", "")
+
+
+def orders_key(account: str) -> str:
+    return f"orders/{account}/задания_{account}.xlsx"
+
+
+def nobuy_key(account: str) -> str:
+    return f"orders/Выходы {account}/поставки_не_купили_{account}.xlsx"
+
+
+def merged_key(account: str) -> str:
+    return f"orders/выходы/задания_с_названием_и_фото_{account}.xlsx"
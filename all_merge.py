@@ -1,11 +1,27 @@
 # -*- coding: utf-8 -*-
-import os
 import sys
+import threading
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
-import boto3
-from botocore.client import Config
+from pandas.api.types import (
+    is_bool_dtype,
+    is_datetime64_any_dtype,
+    is_float_dtype,
+    is_numeric_dtype,
+)
+
+import manifest
+from partition import export_partitions, partition
+from s3_storage import (
+    SNAPSHOT_EXT,
+    s3_bucket,
+    s3_get_bytes,
+    s3_list_etags,
+    s3_read_frame,
+    snapshot_key,
+)
 
 
 FOLDER_IN_PREFIX = "orders/выходы/"
@@ -23,59 +39,16 @@ FILTER_COL = "Пункт выдачи"
 
 ALLOWED_EXT = (".xlsx", ".xls", ".csv")
 
+LOAD_WORKERS = 8
 
-def _must(name: str) -> str:
-    v = (os.environ.get(name) or "").strip()
-    if not v:
-        raise RuntimeError(f"Missing env var: {name}")
-    return v
-
-def s3_client():
-    return boto3.client(
-        "s3",
-        endpoint_url=_must("YC_S3_ENDPOINT"),
-        aws_access_key_id=_must("YC_S3_KEY_ID"),
-        aws_secret_access_key=_must("YC_S3_SECRET"),
-        region_name=(os.environ.get("YC_S3_REGION") or "").strip() or None,
-        config=Config(signature_version="s3v4"),
-    )
-
-def s3_bucket() -> str:
-    return _must("YC_S3_BUCKET")
-
-def s3_list_keys(prefix: str) -> list[str]:
-    keys = []
-    token = None
-    client = s3_client()
-    while True:
-        kwargs = {"Bucket": s3_bucket(), "Prefix": prefix, "MaxKeys": 1000}
-        if token:
-            kwargs["ContinuationToken"] = token
-        resp = client.list_objects_v2(**kwargs)
-        for obj in resp.get("Contents", []) or []:
-            k = obj.get("Key", "")
-            if k and not k.endswith("/"):
-                keys.append(k)
-        if resp.get("IsTruncated"):
-            token = resp.get("NextContinuationToken")
-        else:
-            break
-    return keys
-
-def s3_get_bytes(key: str) -> bytes:
-    obj = s3_client().get_object(Bucket=s3_bucket(), Key=key)
-    return obj["Body"].read()
-
-def s3_put_bytes(key: str, data: bytes, content_type: str):
-    s3_client().put_object(
-        Bucket=s3_bucket(),
-        Key=key,
-        Body=data,
-        ContentType=content_type,
-    )
-
-def load_frame_from_s3(key: str) -> pd.DataFrame:
-    data = s3_get_bytes(key)
+STAGE = "all_merge"
+
+# логический ключ -> (версия по ETag, разобранная таблица); живёт, пока жив процесс панели
+_frame_cache: dict[str, tuple[tuple, pd.DataFrame]] = {}
+_cache_lock = threading.Lock()
+
+
+def load_frame_from_bytes(key: str, data: bytes) -> pd.DataFrame:
     lower = key.lower()
 
     if lower.endswith(".csv"):
@@ -89,38 +62,153 @@ def load_frame_from_s3(key: str) -> pd.DataFrame:
 
     raise ValueError(f"Неподдерживаемое расширение файла: {key}")
 
-def save_excel_to_s3(df: pd.DataFrame, key: str):
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as w:
-        df.to_excel(w, index=False)
-    buf.seek(0)
-    s3_put_bytes(
-        key=key,
-        data=buf.getvalue(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
 
-
-def main() -> None:
-    all_keys = s3_list_keys(FOLDER_IN_PREFIX)
-    file_keys = [k for k in all_keys if k.lower().endswith(ALLOWED_EXT)]
-
-    if not file_keys:
+def _load_one(key: str) -> pd.DataFrame:
+    if key.lower().endswith(".xlsx"):
+        return s3_read_frame(key)
+    return load_frame_from_bytes(key, s3_get_bytes(key))
+
+
+def list_inputs(prefix: str = FOLDER_IN_PREFIX) -> dict[str, tuple]:
+    """
+    {логический ключ: версия}. Выходы merge_with_base лежат как xlsx и/или
+    Parquet-снимок под одним ключом .xlsx; версия — пара ETag'ов из листинга.
+    """
+    etags = s3_list_etags(prefix)
+    inputs = {}
+    for k, etag in etags.items():
+        if k.endswith(SNAPSHOT_EXT):
+            logical = k[:-len(SNAPSHOT_EXT)] + ".xlsx"
+        elif k.lower().endswith(ALLOWED_EXT):
+            logical = k
+        else:
+            continue
+        inputs[logical] = (etags.get(logical, ""), etags.get(snapshot_key(logical), ""))
+    return dict(sorted(inputs.items()))
+
+
+def load_inputs(inputs: dict[str, tuple]) -> dict[str, pd.DataFrame]:
+    """
+    Параллельно читает и разбирает входы. Не изменившиеся с прошлого запуска
+    (та же версия по ETag) берутся из кэша процесса без скачивания.
+    """
+    loaded: dict[str, pd.DataFrame] = {}
+    todo = []
+    with _cache_lock:
+        for key, version in inputs.items():
+            cached = _frame_cache.get(key)
+            if cached is not None and cached[0] == version:
+                loaded[key] = cached[1]
+                print(f"Без изменений (кэш): {key}")
+            else:
+                todo.append(key)
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(todo))) as pool:
+            futures = {key: pool.submit(_load_one, key) for key in todo}
+            for key, f in futures.items():
+                try:
+                    df = f.result()
+                except Exception as e:
+                    print(f"Пропускаю '{key}': {e}")
+                    continue
+                loaded[key] = df
+                with _cache_lock:
+                    _frame_cache[key] = (inputs[key], df)
+                print(f"Загружено: {key}  ({df.shape[0]} строк, {df.shape[1]} столбцов)")
+
+    return {key: loaded[key] for key in inputs if key in loaded}
+
+
+def _as_number(col: pd.Series) -> pd.Series | None:
+    """
+    Текстовая колонка числами, если каждое непустое значение — число; иначе None.
+    Значения с ведущим нулём ('0123' — баркод, артикул) числом не считаются.
+    """
+    text = col.dropna().astype(str).str.strip()
+    if text.str.match(r"^-?0\d").any():
+        return None
+    parsed = pd.to_numeric(text, errors="coerce")
+    if parsed.isna().any():
+        return None
+    return pd.to_numeric(col.where(col.isna(), col.astype(str).str.strip()), errors="coerce")
+
+
+def _unify(col: pd.Series, kind: str) -> pd.Series:
+    if kind == "number":
+        if not is_numeric_dtype(col.dtype):
+            col = _as_number(col)
+        if is_float_dtype(col.dtype) and (col.dropna() % 1 == 0).all():
+            col = col.astype("Int64")  # целые остаются целыми и при пропусках
+        return col
+    if kind == "text":
+        if is_float_dtype(col.dtype) and (col.dropna() % 1 == 0).all():
+            col = col.astype("Int64")  # 123.0 -> '123', а не '123.0'
+        return col.astype("string")
+    return col.astype(object)
+
+
+def align_frames(frames: list[pd.DataFrame]) -> list[pd.DataFrame]:
+    """
+    Общий набор колонок (в порядке первого появления) и согласованные типы:
+    если одна колонка где-то числовая, а где-то текстовая — везде числа, когда
+    текст целиком разбирается в числа (ячейки в Excel остаются числовыми), иначе
+    везде текст; если где-то дата, а где-то нет — object. Иначе типы оставляет concat.
+    """
+    columns: list = []
+    kinds: dict = {}
+    for df in frames:
+        for c in df.columns:
+            if c not in kinds:
+                columns.append(c)
+                kinds[c] = set()
+            col = df[c]
+            if col.isna().all():
+                continue  # пустая колонка ничего не говорит о типе
+            if is_datetime64_any_dtype(col.dtype):
+                kinds[c].add("datetime")
+            elif is_numeric_dtype(col.dtype) and not is_bool_dtype(col.dtype):
+                kinds[c].add("number")
+            else:
+                kinds[c].add("text")
+
+    target = {}
+    for c, k in kinds.items():
+        if "datetime" in k and len(k) > 1:
+            target[c] = "object"
+        elif k == {"number", "text"}:
+            texts = [df[c] for df in frames if c in df.columns and not is_numeric_dtype(df[c].dtype)]
+            target[c] = "number" if all(_as_number(col) is not None for col in texts) else "text"
+
+    aligned = []
+    for df in frames:
+        df = df.reindex(columns=columns)
+        for c, kind in target.items():
+            df[c] = _unify(df[c], kind)
+        aligned.append(df)
+    return aligned
+
+
+def run(force: bool = False) -> int:
+    inputs = list_inputs()
+    if not inputs:
         raise FileNotFoundError(f"В S3 нет файлов {ALLOWED_EXT} по префиксу: {FOLDER_IN_PREFIX}")
 
-    frames: list[pd.DataFrame] = []
-    for key in file_keys:
-        try:
-            df = load_frame_from_s3(key)
-            frames.append(df)
-            print(f"Загружено: {key}  ({df.shape[0]} строк, {df.shape[1]} столбцов)")
-        except Exception as e:
-            print(f"Пропускаю '{key}': {e}")
+    # версии в формате manifest.versions: 'etag xlsx|etag снимка'
+    stage_inputs = {k: "|".join(v) for k, v in inputs.items()}
+    prev = None if force else manifest.fresh(STAGE, stage_inputs)
+    if prev is not None:
+        print(f"Без изменений с {prev['ts']}: входы те же — НА_ЗАКУПКУ_* актуальны, пропуск")
+        return prev["result"]
+
+    for line in manifest.upstream_warnings(inputs):
+        print(line)
 
+    frames = list(load_inputs(inputs).values())
     if not frames:
         raise RuntimeError("Не удалось загрузить ни одного файла из S3.")
 
-    combined = pd.concat(frames, ignore_index=True)
+    combined = pd.concat(align_frames(frames), ignore_index=True)
 
     if SORT_COL not in combined.columns:
         raise KeyError(f"Нет столбца для сортировки: '{SORT_COL}'. Доступные: {list(combined.columns)}")
@@ -128,27 +216,37 @@ def main() -> None:
         raise KeyError(f"Нет столбца для фильтрации: '{FILTER_COL}'. Доступные: {list(combined.columns)}")
 
     key_series = combined[SORT_COL].astype(str).str.lower()
-    sorted_df = combined.assign(_key=key_series).sort_values("_key").drop(columns="_key")
+    sorted_df = combined.assign(_key=key_series).sort_values("_key", kind="stable").drop(columns="_key")
+
+    parts = partition(sorted_df, sorted_df[FILTER_COL], PICKUP_POINTS)
+    out_keys = {point: f"{FOLDER_OUT_PREFIX}{out_name}" for point, out_name in PICKUP_POINTS.items()}
+    failed = export_partitions({out_keys[p]: df for p, df in parts.items()})
 
     saved = 0
-    for point, out_name in PICKUP_POINTS.items():
-        df_point = sorted_df[sorted_df[FILTER_COL] == point]
-        if df_point.empty:
+    for point in PICKUP_POINTS:
+        out_key = out_keys[point]
+        if point not in parts:
             print(f"Для '{point}' данных нет.")
-            continue
+        elif out_key in failed:
+            print(f"Ошибка записи s3://{s3_bucket()}/{out_key}: {failed[out_key]}")
+        else:
+            print(f"Сохранено: s3://{s3_bucket()}/{out_key}  ({parts[point].shape[0]} строк)")
+            saved += 1
+
+    if failed:
+        raise RuntimeError(f"Не удалось сохранить: {', '.join(failed)}")
 
-        out_key = f"{FOLDER_OUT_PREFIX}{out_name}"
-        save_excel_to_s3(df_point, out_key)
-        print(f"Сохранено: s3://{s3_bucket()}/{out_key}  ({df_point.shape[0]} строк)")
-        saved += 1
+    manifest.record(STAGE, stage_inputs, [out_keys[p] for p in parts], saved)
 
     if saved == 0:
         print("Ни по одному пункту выдачи данных не нашлось — ничего не сохранено.")
 
+    return saved
+
 
 if __name__ == "__main__":
     try:
-        main()
+        run(force="--force" in sys.argv)
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
         raise
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+ANTIMERGE: раскладка загруженных ЗАДАНИЯ_<город>.xlsx по группам в
+закупленные/закупленные_<город>/{группа}.xlsx.
+
+Регионы берутся из regions.REGIONS. Все загруженные файлы обрабатываются
+параллельно, части каждого региона пишутся в S3 параллельно. Входы и
+выходы каждого региона записываются в манифест стадии antimerge/<регион>:
+регион, чей файл с тех пор не менялся, пропускается.
+"""
+import sys
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import manifest
+from partition import export_partitions, partition
+from regions import REGIONS, bought_key, tasks_key
+from s3_storage import s3_bucket, s3_list_keys, s3_read_excel, s3_write_frame
+
+INPUT_PREFIX = "orders/готовые/"
+
+TARGET_GROUPS = ["A", "B", "C", "D", "E", "F", "G", "H"]
+
+GROUP_COL = "Группа"
+SORT_COL = "Артикул продавца"
+
+
+def split_groups(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """{группа: строки группы, отсортированные по артикулу}; группы без учёта регистра."""
+    for col in (GROUP_COL, SORT_COL):
+        if col not in df.columns:
+            raise RuntimeError(f"В входной таблице нет колонки '{col}'")
+
+    df = df.copy()
+    df[GROUP_COL] = df[GROUP_COL].astype(str).str.strip()
+
+    # сортируем один раз, разбиение сохраняет порядок
+    df = df.sort_values(by=SORT_COL, key=lambda col: col.astype(str).str.lower(), kind="stable")
+    return partition(df, df[GROUP_COL].str.upper(), TARGET_GROUPS)
+
+
+def process_region(region: str) -> tuple[dict[str, int], dict[str, Exception]]:
+    """Читает ЗАДАНИЯ региона и пишет части. Возвращает ({группа: строк}, {ключ: ошибка записи})."""
+    parts = split_groups(s3_read_excel(tasks_key(region)))
+
+    # закупленные открывают люди: xlsx + снимок для создания поставок
+    write = partial(s3_write_frame, excel=True)
+    failed = export_partitions({bought_key(region, g): gdf for g, gdf in parts.items()}, write=write)
+    return {g: len(gdf) for g, gdf in parts.items()}, failed
+
+
+def _report(region: str, sizes: dict[str, int], failed: dict[str, Exception]) -> int:
+    saved = 0
+    for group in TARGET_GROUPS:
+        out_key = bought_key(region, group)
+        if group not in sizes:
+            print(f"Группа {group}: данных нет")
+        elif out_key in failed:
+            print(f"Ошибка записи s3://{s3_bucket()}/{out_key}: {failed[out_key]}")
+        else:
+            print(f"Сохранено: s3://{s3_bucket()}/{out_key}  ({sizes[group]} строк)")
+            saved += 1
+
+    if saved == 0 and not failed:
+        print("Ни по одной группе данные не найдены.")
+    return saved
+
+
+def stage_name(region: str) -> str:
+    return f"antimerge/{region}"
+
+
+def _process_and_record(region: str, inputs: dict[str, str]):
+    sizes, failed = process_region(region)
+    if not failed:
+        outputs = [bought_key(region, g) for g in sizes]
+        manifest.record(stage_name(region), inputs, outputs, len(outputs))
+    return sizes, failed
+
+
+def run_region(region: str, force: bool = False) -> int:
+    """Один регион (кнопка региона в панели). Возвращает число записанных групп."""
+    inputs = manifest.versions([tasks_key(region)])
+    prev = None if force else manifest.fresh(stage_name(region), inputs)
+    if prev is not None:
+        print(f"Без изменений с {prev['ts']}: {tasks_key(region)} тот же — пропуск")
+        return prev["result"]
+
+    sizes, failed = _process_and_record(region, inputs)
+    saved = _report(region, sizes, failed)
+    if failed:
+        raise RuntimeError(f"Не удалось сохранить: {', '.join(failed)}")
+    return saved
+
+
+def run(regions=None, force: bool = False) -> dict[str, int]:
+    """
+    Все (или выбранные) регионы, чьи ЗАДАНИЯ_* загружены и изменились с прошлого раза.
+    Возвращает {регион: число записанных групп}.
+    """
+    regions = list(regions or REGIONS)
+    uploaded = set(s3_list_keys(INPUT_PREFIX))
+    current = manifest.versions([tasks_key(r) for r in regions if tasks_key(r) in uploaded])
+
+    todo = []
+    for r in regions:
+        if tasks_key(r) not in uploaded:
+            print(f"{r.upper()}: {tasks_key(r)} не загружен — пропуск")
+        elif not force and manifest.fresh(stage_name(r), {tasks_key(r): current[tasks_key(r)]}):
+            print(f"{r.upper()}: без изменений с прошлого запуска — пропуск")
+        else:
+            todo.append(r)
+
+    results: dict[str, int] = {}
+    errors: dict[str, Exception] = {}
+    if todo:
+        with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+            futures = {
+                r: pool.submit(_process_and_record, r, {tasks_key(r): current[tasks_key(r)]})
+                for r in todo
+            }
+            for r, f in futures.items():
+                print(f"\n=== {r.upper()} ({tasks_key(r)}) ===")
+                try:
+                    sizes, failed = f.result()
+                except Exception as e:
+                    print(f"ОШИБКА: {e}")
+                    errors[r] = e
+                    continue
+                results[r] = _report(r, sizes, failed)
+                if failed:
+                    errors[r] = RuntimeError(f"не сохранены: {', '.join(failed)}")
+
+    if errors:
+        raise RuntimeError(f"ANTIMERGE не выполнен для регионов: {', '.join(errors)}")
+    return results
+
+
+if __name__ == "__main__":
+    # python antimerge_engine.py [msk krd ...] [--force]
+    try:
+        args = [a for a in sys.argv[1:] if a != "--force"]
+        run(args or None, force="--force" in sys.argv)
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        raise
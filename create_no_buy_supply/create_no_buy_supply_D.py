@@ -15,13 +15,13 @@ API_D = st.secrets.get("API_D", "")
 CREATE_SUPPLY_URL = "https://marketplace-api.wildberries.ru/api/v3/supplies"
 HEADERS = {"Authorization": API_D}
 
-def main():
+def run(supply_name: str | None = None) -> str:
     if not API_D or API_D.startswith("<"):
         print("Ошибка: не задан API-ключ (WB_API_KEY).")
         sys.exit(1)
 
     # Имя можно передать первым аргументом, иначе возьмём дефолт с датой
-    supply_name = sys.argv[1] if len(sys.argv) > 1 else f"NO BUY {datetime.now():%Y-%m-%d}"
+    supply_name = supply_name or f"NO BUY {datetime.now():%Y-%m-%d}"
 
     try:
         resp = requests.post(CREATE_SUPPLY_URL, headers=HEADERS, json={"name": supply_name}, timeout=30)
@@ -53,6 +53,10 @@ def main():
 
     # Выводим только ID — удобно для последующего пайплайна (CLI/скрипты)
     print(supply_id)
+    return supply_id
+
+def main():
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
 
 if __name__ == "__main__":
     main()
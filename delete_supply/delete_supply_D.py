@@ -13,16 +13,12 @@ API_D = st.secrets.get("API_D", "")
 
 BASE_URL = "https://marketplace-api.wildberries.ru/api/v3/supplies"
 
-def main():
+def run(supply_id: str) -> bool:
     if not API_D or API_D.startswith("<"):
         print("Ошибка: не задан API-ключ (переменная окружения WB_API_KEY).")
         sys.exit(1)
 
-    if len(sys.argv) < 2:
-        print("Использование: python delete_supply.py <supplyId>")
-        sys.exit(1)
-
-    supply_id = sys.argv[1].strip()
+    supply_id = supply_id.strip()
     url = f"{BASE_URL}/{supply_id}"
     headers = {"Authorization": API_D}
 
@@ -35,7 +31,7 @@ def main():
     # 204 — успешное удаление, без тела
     if resp.status_code == 204:
         print("OK")  # печатаем краткий маркер успеха (удобно для пайплайнов)
-        sys.exit(0)
+        return True
 
     # Печатаем подробности ошибки
     try:
@@ -56,5 +52,11 @@ def main():
         print("Подсказка: превышен лимит запросов — подождите и повторите попытку.")
     sys.exit(1)
 
+def main():
+    if len(sys.argv) < 2:
+        print("Использование: python delete_supply.py <supplyId>")
+        sys.exit(1)
+    run(sys.argv[1])
+
 if __name__ == "__main__":
     main()
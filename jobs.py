@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Запуск скриптов пайплайна внутри процесса панели.
+
+Вместо subprocess.run на каждую кнопку скрипт импортируется один раз
+(pandas/boto3/openpyxl уже загружены) и его run() выполняется в тёплом
+пуле потоков. Вывод print() перехватывается отдельно для каждого потока,
+поэтому параллельные задачи не смешивают логи и не трогают чужой stdout.
+
+Долгие операции запускаются фоновыми задачами (submit_job / submit_script):
+у задачи есть ID, лог, который можно читать по ходу работы, счётчик
+прогресса и кооперативная отмена — панель опрашивает их, не блокируя скрипт.
+"""
+import io
+import sys
+import time
+import threading
+import importlib
+import traceback
+import uuid
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+MAX_WORKERS = 4
+TIMED_WORKERS = 4
+BACKGROUND_WORKERS = 4
+JOBS_KEEP = 100
+
+
+@dataclass
+class JobResult:
+    ok: bool
+    log: str = ""
+    value: object = None
+    error: str = ""
+    elapsed: float = 0.0
+
+
+class _ThreadLocalStream:
+    """Подменяет sys.stdout/sys.stderr: пишет в буфер текущего потока, если он задан."""
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+        self._local = threading.local()
+
+    def _target(self):
+        buf = getattr(self._local, "buf", None)
+        return buf if buf is not None else self._fallback
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._fallback, name)
+
+
+_install_lock = threading.Lock()
+
+
+def _install_streams():
+    with _install_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStream):
+            sys.stdout = _ThreadLocalStream(sys.stdout)
+        if not isinstance(sys.stderr, _ThreadLocalStream):
+            sys.stderr = _ThreadLocalStream(sys.stderr)
+
+
+class capture_output:
+    """Контекст: весь print() текущего потока (stdout и stderr) уходит в общий буфер."""
+
+    def __init__(self, buf=None):
+        self.buf = buf if buf is not None else io.StringIO()
+
+    def __enter__(self):
+        _install_streams()
+        sys.stdout._local.buf = self.buf
+        sys.stderr._local.buf = self.buf
+        return self.buf
+
+    def __exit__(self, *exc):
+        sys.stdout._local.buf = None
+        sys.stderr._local.buf = None
+        return False
+
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+# вызовы с таймаутом — в своём пуле: поток нельзя прервать, и вызов, переживший
+# таймаут, дорабатывает здесь, не занимая воркеры основного пула (см. run_callable)
+_timed_executor = ThreadPoolExecutor(max_workers=TIMED_WORKERS, thread_name_prefix="timed")
+
+
+def module_name_for(script: str) -> str:
+    """'get_orders/get_orders_A.py' -> 'get_orders.get_orders_A'"""
+    p = Path(script)
+    if p.is_absolute():
+        p = p.relative_to(PROJECT_ROOT)
+    return ".".join(p.with_suffix("").parts)
+
+
+def load_script(script: str):
+    return importlib.import_module(module_name_for(script))
+
+
+def _execute(func, args, kwargs, buf=None) -> JobResult:
+    started = time.monotonic()
+    with capture_output(buf) as buf:
+        try:
+            value = func(*args, **kwargs)
+            ok, error = True, ""
+        except JobCancelled as e:
+            value = None
+            ok, error = False, str(e)
+            print(f"⛔ {e}")
+        except SystemExit as e:
+            value = None
+            ok = e.code in (0, None)
+            error = "" if ok else f"exit code {e.code}"
+        except Exception as e:
+            value = None
+            ok, error = False, str(e)
+            traceback.print_exc()
+    return JobResult(ok=ok, log=buf.getvalue(), value=value, error=error,
+                     elapsed=time.monotonic() - started)
+
+
+def _run_entry(script, entry, args, kwargs):
+    return getattr(load_script(script), entry)(*args, **kwargs)
+
+
+def _execute_started(started: threading.Event, func, args, kwargs, buf) -> JobResult:
+    started.set()
+    return _execute(func, args, kwargs, buf=buf)
+
+
+def run_callable(func, *args, timeout: float | None = None, **kwargs) -> JobResult:
+    """
+    Выполняет func(*args, **kwargs) в пуле и возвращает JobResult с логом.
+    timeout ограничивает время работы вызова, отсчёт — с момента его старта.
+    Вызов, который не дождался свободного потока за timeout, снимается с очереди и
+    не выполняется. Начавшийся вызов прервать нельзя: по таймауту возвращается
+    накопленный лог, а сам вызов дорабатывает в отдельном пуле из TIMED_WORKERS
+    потоков, не занимая воркеры основного пула.
+    """
+    if timeout is None:
+        return _executor.submit(_execute, func, args, kwargs).result()
+    buf = _JobLog()
+    started = threading.Event()
+    future = _timed_executor.submit(_execute_started, started, func, args, kwargs, buf)
+    if not started.wait(timeout) and future.cancel():
+        return JobResult(ok=False, error=f"не начался за {timeout} s: все {TIMED_WORKERS} потока заняты — "
+                                         f"вызов снят с очереди и не выполнялся")
+    started.wait()
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        return JobResult(ok=False, log=buf.getvalue(),
+                         error=f"timeout {timeout} s: вызов не прерван и продолжает работать в фоне",
+                         elapsed=float(timeout))
+
+
+def run_script(script: str, *args, entry: str = "run", timeout: float | None = None, **kwargs) -> JobResult:
+    """Импортирует скрипт (один раз на процесс) и вызывает его run(*args, **kwargs) в пуле."""
+    return run_callable(_run_entry, script, entry, args, kwargs, timeout=timeout)
+
+
+# --- Фоновые задачи ---
+
+class JobCancelled(RuntimeError):
+    pass
+
+
+class _JobLog:
+    """Буфер лога задачи: пишет поток задачи, читает панель — под замком."""
+
+    def __init__(self):
+        self._buf = io.StringIO()
+        self._lock = threading.Lock()
+
+    def write(self, s):
+        with self._lock:
+            return self._buf.write(s)
+
+    def flush(self):
+        pass
+
+    def getvalue(self) -> str:
+        with self._lock:
+            return self._buf.getvalue()
+
+
+FINAL_STATUSES = {"done", "failed", "cancelled"}
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    owner: str = ""
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    done: int = 0
+    total: int = 0
+    result: JobResult | None = None
+    submitted: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    _log: _JobLog = field(default_factory=_JobLog, repr=False)
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _future: object = field(default=None, repr=False)
+
+    @property
+    def log(self) -> str:
+        return self._log.getvalue()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Просит задачу остановиться; ещё не начатая задача снимается сразу."""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self.status = "cancelled"
+            self.finished_at = time.time()
+
+
+_bg_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="bgjob")
+_jobs: dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+_current = threading.local()
+
+
+def current_job() -> Job | None:
+    """Фоновая задача, которую выполняет текущий поток (None — вне задачи)."""
+    return getattr(_current, "job", None)
+
+
+def progress(done: int, total: int | None = None):
+    """Обновляет счётчик прогресса текущей задачи; вне задачи ничего не делает."""
+    job = current_job()
+    if job is not None:
+        job.done = done
+        if total is not None:
+            job.total = total
+
+
+def cancel_requested(job: Job | None = None) -> bool:
+    """Попросили ли отменить задачу job (по умолчанию — текущую задачу потока)."""
+    job = job or current_job()
+    return job is not None and job.cancel_requested
+
+
+def check_cancelled(pending=(), job: Job | None = None):
+    """
+    Бросает JobCancelled, если задачу попросили отменить.
+    pending — futures пула, которые надо снять до выхода (уже идущие доработают).
+    job — задача, если проверка идёт в рабочем потоке пула, где current_job() пуст.
+    """
+    if cancel_requested(job):
+        for f in pending:
+            f.cancel()
+        raise JobCancelled("Задача отменена")
+
+
+def _run_job(job: Job, func, args, kwargs):
+    _current.job = job
+    job.status = "running"
+    try:
+        job.result = _execute(func, args, kwargs, buf=job._log)
+    finally:
+        _current.job = None
+    if job.result.ok:
+        job.status = "done"
+    elif job.cancel_requested:
+        job.status = "cancelled"
+    else:
+        job.status = "failed"
+    job.finished_at = time.time()
+
+
+def _prune():
+    finished = sorted((j for j in _jobs.values() if j.finished), key=lambda j: j.submitted)
+    for job in finished[:max(0, len(_jobs) - JOBS_KEEP)]:
+        del _jobs[job.id]
+
+
+def submit_job(name: str, func, *args, owner: str = "", **kwargs) -> Job:
+    """Ставит func(*args, **kwargs) в фоновую очередь и сразу возвращает Job."""
+    job = Job(id=uuid.uuid4().hex[:8], name=name, owner=owner)
+    with _jobs_lock:
+        _prune()
+        _jobs[job.id] = job
+    job._future = _bg_executor.submit(_run_job, job, func, args, kwargs)
+    return job
+
+
+def submit_script(name: str, script: str, *args, entry: str = "run", owner: str = "", **kwargs) -> Job:
+    """Как run_script, но в фоне: импортирует скрипт и ставит его run() в очередь."""
+    return submit_job(name, _run_entry, script, entry, args, kwargs, owner=owner)
+
+
+def get_job(job_id: str) -> Job | None:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(owner: str | None = None) -> list[Job]:
+    """Задачи процесса (или одного владельца), новые первыми."""
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    if owner is not None:
+        jobs = [j for j in jobs if j.owner == owner]
+    return sorted(jobs, key=lambda j: j.submitted, reverse=True)
+
+
+def active_job(name: str) -> Job | None:
+    """Незавершённая задача с таким именем — чтобы не запускать одно и то же дважды."""
+    return next((j for j in list_jobs() if j.name == name and not j.finished), None)
@@ -1,12 +1,71 @@
 import os
-import time
-import requests
-import pandas as pd
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
 
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(PROJECT_ROOT))
+
+from jobs import check_cancelled, progress
+from order_ids import format_report, order_id_report, order_id_series
+from wb_api import CONFLICT_COST, MARKETPLACE_URL, limiter_for, make_session, request
 
 FOLDER_DEFAULT = r"D:/Софт/скрипты и аутпутс/Листы подбора/обработка"
-REQUEST_DELAY = 0.07
+EXPIRATION_URL = f"{MARKETPLACE_URL}/api/v3/orders/{{orderId}}/meta/expiration"
+
+# Темп задаёт лимитер кабинета (wb_api), потоки лишь прячут задержку сети.
+MAX_WORKERS = 4
+ID_COLS = ["№ задания", "Order ID", "ID задания", "ID заказа"]
+
+# Журнал отправок лежит рядом с листами: по строке JSON на каждый ответ WB.
+# По нему перезапуск продолжает с неотправленных заказов.
+JOURNAL_NAME = ".expiration_journal.jsonl"
+FAILED_STATUSES = {"conflict", "error"}
+
+
+class Journal:
+    """Append-only JSONL: {account, order_id, expiration, status, code, ts}. Последняя запись побеждает."""
+
+    def __init__(self, folder: str, account: str):
+        self.path = os.path.join(folder, JOURNAL_NAME)
+        self.account = account
+        self.last: dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # недописанная строка после обрыва
+                    if rec.get("account") == account:
+                        self.last[rec["order_id"]] = rec
+        self._f = None
+
+    def status(self, order_id: str, expiration: str) -> str | None:
+        rec = self.last.get(order_id)
+        if rec is None or rec.get("expiration") != expiration:
+            return None
+        return rec["status"]
+
+    def write(self, order_id: str, expiration: str, status: str, code: int | None = None):
+        rec = {
+            "account": self.account, "order_id": order_id, "expiration": expiration,
+            "status": status, "code": code, "ts": datetime.now().isoformat(timespec="seconds"),
+        }
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+        self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._f.flush()
+        self.last[order_id] = rec
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
 
 
 def _format_date(d):
@@ -15,52 +74,130 @@ def _format_date(d):
     return d.strftime("%d.%m.%Y")
 
 
-def _send_expiration(order_id: str, expiration: str, api_key: str):
-    url = f"https://marketplace-api.wildberries.ru/api/v3/orders/{order_id}/meta/expiration"
-    headers = {"Authorization": api_key}
-    return requests.put(url, json={"expiration": expiration}, headers=headers)
+def _send_expiration(session, limiter_key: str, order_id: str, expiration: str):
+    r = request(
+        session, "PUT", EXPIRATION_URL.format(orderId=order_id),
+        account=limiter_key, json={"expiration": expiration},
+    )
+    if r.status_code == 409:
+        # 409 стоит как 10 запросов: первый уже списан при отправке
+        limiter_for(limiter_key).charge(CONFLICT_COST - 1)
+    return r
 
 
-def process_file(path: str, api_key: str):
+def read_file(path: str) -> dict[str, str]:
+    """{order_id: срок годности 'дд.мм.гггг'} из листа подбора."""
     print(f"\nОбработка: {path}")
     df = pd.read_excel(path)
 
     if "Срок годности" not in df.columns:
         print("⚠️ Нет столбца 'Срок годности' — пропуск.")
-        return
+        return {}
 
-    id_cols = ["№ задания", "Order ID", "ID задания", "ID заказа"]
-    col_order = next((c for c in id_cols if c in df.columns), None)
+    col_order = next((c for c in ID_COLS if c in df.columns), None)
 
     if not col_order:
         print("❌ Не найден столбец с ID заказа — пропуск.")
-        return
+        return {}
 
-    for _, row in df.iterrows():
-        order_id = str(row[col_order]).strip()
-        exp = row["Срок годности"]
+    df = df[df["Срок годности"].notna()]
+    ids = order_id_series(df[col_order])
+    report = order_id_report(df[col_order], ids)
+    for line in format_report(report):
+        print(line)
 
-        if not order_id or pd.isna(exp):
+    items = {}
+    for order_id, exp in zip(ids, df["Срок годности"]):
+        if pd.isna(order_id):
             continue
+        items[str(order_id)] = _format_date(exp)
+    print(f"Строк со сроком: {len(items)}")
+    return items
 
-        expiration = _format_date(exp)
-
-        r = _send_expiration(order_id, expiration, api_key)
 
-        if r.status_code == 204:
-            print(f"✅ {order_id} → {expiration}")
-        elif r.status_code == 409:
-            print(f"⚠️ {order_id} — 409 (WB отклонил, засчитывается как 10 запросов)")
-        else:
-            print(f"❌ {order_id} — {r.status_code}: {r.text}")
-
-        time.sleep(REQUEST_DELAY)
+def select(items: dict[str, str], journal: Journal, retry_failed: bool = False) -> dict[str, str]:
+    """
+    Обычный режим — только заказы без записи в журнале (или с новым сроком).
+    retry_failed — только те, что в прошлый раз получили 409 или ошибку.
+    """
+    if retry_failed:
+        return {o: e for o, e in items.items() if journal.status(o, e) in FAILED_STATUSES}
+    return {o: e for o, e in items.items() if journal.status(o, e) is None}
 
 
-def run(api_key: str, folder: str = FOLDER_DEFAULT):
+def submit(items: dict[str, str], api_key: str, limiter_key: str, journal: Journal) -> dict[str, int]:
+    """
+    Отправляет сроки параллельно через одну сессию и общий лимитер кабинета.
+    Каждый ответ сразу пишется в журнал. Печать и журнал — только из вызывающего потока.
+    При отмене фоновой задачи неотправленные заказы снимаются — журнал позволит продолжить.
+    """
+    stats = {"ok": 0, "conflict": 0, "error": 0}
+    if not items:
+        return stats
+
+    session = make_session(api_key, pool_size=MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {
+            pool.submit(_send_expiration, session, limiter_key, o, e): (o, e)
+            for o, e in items.items()
+        }
+        for done, f in enumerate(as_completed(futures), start=1):
+            order_id, expiration = futures[f]
+            try:
+                r = f.result()
+            except Exception as ex:
+                stats["error"] += 1
+                journal.write(order_id, expiration, "error")
+                print(f"❌ {order_id} — {ex}")
+            else:
+                if r.status_code == 204:
+                    stats["ok"] += 1
+                    journal.write(order_id, expiration, "ok", 204)
+                    print(f"✅ {order_id} → {expiration}")
+                elif r.status_code == 409:
+                    stats["conflict"] += 1
+                    journal.write(order_id, expiration, "conflict", 409)
+                    print(f"⚠️ {order_id} — 409 (WB отклонил, засчитывается как 10 запросов)")
+                else:
+                    stats["error"] += 1
+                    journal.write(order_id, expiration, "error", r.status_code)
+                    print(f"❌ {order_id} — {r.status_code}: {r.text}")
+
+            progress(done, len(futures))
+            check_cancelled(futures)
+    return stats
+
+
+def run(api_key: str, folder: str = FOLDER_DEFAULT, account: str | None = None,
+        retry_failed: bool = False):
     """
     Главная точка входа для приложения.
+    Собирает сроки из всех листов папки и отправляет одним пулом в пределах квоты кабинета.
+    Уже отправленное по журналу папки пропускается; retry_failed — повторить только неудачные.
     """
-    for f in os.listdir(folder):
+    items: dict[str, str] = {}
+    for f in sorted(os.listdir(folder)):
         if f.lower().endswith(".xlsx") and not f.startswith("~$"):
-            process_file(os.path.join(folder, f), api_key)
+            items.update(read_file(os.path.join(folder, f)))
+
+    limiter_key = account or f"expiration:{api_key[-8:]}"
+    journal = Journal(folder, limiter_key)
+    todo = select(items, journal, retry_failed)
+    skipped = len(items) - len(todo)
+    if skipped:
+        print(f"По журналу пропущено: {skipped}")
+
+    if not todo:
+        print("Нечего отправлять.")
+        return {"ok": 0, "conflict": 0, "error": 0, "skipped": skipped}
+
+    try:
+        stats = submit(todo, api_key, limiter_key, journal)
+    finally:
+        journal.close()
+    stats["skipped"] = skipped
+    print(
+        f"\nИтого: отправлено {stats['ok']}, 409 — {stats['conflict']}, "
+        f"ошибок {stats['error']}, пропущено {stats['skipped']}"
+    )
+    return stats
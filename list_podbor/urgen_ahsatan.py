@@ -127,11 +127,11 @@ def process_file(path):
     print(f"Обновлён: {path}")
 
 
-def main():
+def run():
     for file in os.listdir(FOLDER):
         if file.lower().endswith(".xlsx") and not file.startswith("~$"):
             process_file(os.path.join(FOLDER, file))
 
 
 if __name__ == "__main__":
-    main()
+    run()
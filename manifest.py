@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Манифесты стадий пайплайна: manifests/{стадия}.json в S3.
+
+Для каждого запуска стадии запоминаются версии входов (ETag'и), выходы с их
+версиями и результат. Повторный запуск с теми же входами и нетронутыми
+выходами сразу возвращает прошлый результат. По манифестам же видно,
+какие выходы устарели, потому что их входы с тех пор изменились.
+
+Версия ключа .xlsx — пара ETag'ов самого xlsx и его Parquet-снимка
+(пустая строка — объекта нет), так что учитываются оба варианта хранения.
+"""
+import json
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from s3_storage import BULK_WORKERS, s3_etag, s3_get_json, s3_get_many, s3_list_keys, s3_put_json, snapshot_key
+
+MANIFEST_PREFIX = "manifests/"
+
+
+def manifest_key(stage: str) -> str:
+    return f"{MANIFEST_PREFIX}{stage}.json"
+
+
+def _etag_or_empty(key: str) -> str:
+    try:
+        return s3_etag(key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return ""
+        raise
+
+
+def versions(keys) -> dict[str, str]:
+    """{ключ: версия} для логических ключей; HEAD-запросы идут параллельно."""
+    keys = sorted(set(keys))
+    objects = keys + [snapshot_key(k) for k in keys if k.lower().endswith(".xlsx")]
+    if not objects:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(BULK_WORKERS, len(objects))) as pool:
+        etags = dict(zip(objects, pool.map(_etag_or_empty, objects)))
+
+    result = {}
+    for k in keys:
+        snap = etags.get(snapshot_key(k), "") if k.lower().endswith(".xlsx") else ""
+        result[k] = f"{etags[k]}|{snap}"
+    return result
+
+
+def load(stage: str) -> dict | None:
+    return s3_get_json(manifest_key(stage))
+
+
+def fresh(stage: str, inputs: dict[str, str]) -> dict | None:
+    """Прошлый манифест, если входы те же, а выходы на месте и не менялись; иначе None."""
+    m = load(stage)
+    if not m or m.get("inputs") != inputs:
+        return None
+    if versions(m.get("outputs", [])) != m.get("output_versions"):
+        return None
+    return m
+
+
+def record(stage: str, inputs: dict[str, str], outputs, result=None):
+    outputs = sorted(set(outputs))
+    s3_put_json(manifest_key(stage), {
+        "stage": stage,
+        "inputs": inputs,
+        "outputs": outputs,
+        "output_versions": versions(outputs),
+        "result": result,
+        "ts": datetime.now().isoformat(timespec="seconds"),
+    })
+
+
+def _load_all() -> dict[str, dict]:
+    """{стадия: манифест} по всем записанным манифестам (одним пакетом)."""
+    blobs = s3_get_many(k for k in s3_list_keys(MANIFEST_PREFIX) if k.endswith(".json"))
+    manifests = [json.loads(b.decode("utf-8")) for b in blobs.values()]
+    return {m["stage"]: m for m in manifests}
+
+
+def _stale(manifests: dict[str, dict]) -> dict[str, list[str]]:
+    current = versions(k for m in manifests.values() for k in m.get("inputs", {}))
+    stale = {}
+    for stage, m in manifests.items():
+        changed = [k for k, v in m.get("inputs", {}).items() if current.get(k) != v]
+        if changed:
+            stale[stage] = changed
+    return stale
+
+
+def stale_stages() -> dict[str, list[str]]:
+    """{стадия: изменившиеся с её запуска входы} по всем записанным манифестам."""
+    return _stale(_load_all())
+
+
+def upstream_warnings(input_keys) -> list[str]:
+    """Предупреждения о входах, которые сами являются устаревшими выходами других стадий."""
+    input_keys = set(input_keys)
+    manifests = _load_all()
+    lines = []
+    for stage, changed in sorted(_stale(manifests).items()):
+        hit = input_keys & set(manifests[stage].get("outputs", []))
+        if hit:
+            lines.append(
+                f"⚠️ Устаревший вход: стадия '{stage}' не перезапускалась после изменения "
+                f"{', '.join(changed)} (затронуто: {', '.join(sorted(hit))})"
+            )
+    return lines
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Объединение заданий и заказов НЕ КУПИЛИ с базой товаров для всех кабинетов за один проход.
+
+База разбирается один раз (product_db), входные файлы всех кабинетов
+скачиваются одним пакетом, а объединение и запись результатов идут
+параллельно по кабинетам. Кабинеты с неизменившимися входами (manifest)
+пропускаются.
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import manifest
+from accounts import ACCOUNTS, merged_key, nobuy_key, orders_key
+from product_db import DATABASE_KEY, attach_names_and_photos, load_barcode_table
+from s3_storage import s3_bucket, s3_read_frame, s3_read_frames, s3_write_frame
+
+
+def merge_frames(tasks_df: pd.DataFrame, supply_df: pd.DataFrame) -> pd.DataFrame:
+    combined_tasks = pd.concat([tasks_df, supply_df], ignore_index=True)
+
+    merged_df = attach_names_and_photos(combined_tasks)
+
+    sort_cols = []
+    if "Пункт выдачи" in merged_df.columns:
+        sort_cols.append("Пункт выдачи")
+    if "Артикул продавца" in merged_df.columns:
+        sort_cols.append("Артикул продавца")
+    if sort_cols:
+        merged_df.sort_values(by=sort_cols, inplace=True)
+    return merged_df
+
+
+def stage_name(account: str) -> str:
+    return f"merge/{account}"
+
+
+def run_account(account: str, tasks_key: str | None = None, supply_key: str | None = None,
+                out_key: str | None = None, force: bool = False) -> int:
+    """Объединение одного кабинета. Возвращает число строк."""
+    tasks_key = tasks_key or orders_key(account)
+    supply_key = supply_key or nobuy_key(account)
+    out_key = out_key or merged_key(account)
+
+    inputs = manifest.versions([tasks_key, supply_key, DATABASE_KEY])
+    prev = None if force else manifest.fresh(stage_name(account), inputs)
+    if prev is not None:
+        print(f"Без изменений с {prev['ts']}: задания, НЕ КУПИЛИ и база те же — пропуск")
+        print(f"Rows: {prev['result']}")
+        return prev["result"]
+
+    merged_df = merge_frames(s3_read_frame(tasks_key), s3_read_frame(supply_key))
+    s3_write_frame(merged_df, out_key)
+    manifest.record(stage_name(account), inputs, [out_key], len(merged_df))
+
+    print(f"OK: saved to s3://{s3_bucket()}/{out_key}")
+    print(f"Rows: {len(merged_df)}")
+    return len(merged_df)
+
+
+def _merge_and_save(account: str, frames: dict[str, pd.DataFrame], inputs: dict[str, str]) -> int:
+    merged_df = merge_frames(frames[orders_key(account)], frames[nobuy_key(account)])
+    s3_write_frame(merged_df, merged_key(account))
+    manifest.record(stage_name(account), inputs, [merged_key(account)], len(merged_df))
+    return len(merged_df)
+
+
+def run(accounts=None, force: bool = False) -> dict[str, int]:
+    """
+    Объединяет все (или выбранные) кабинеты. Кабинеты, у которых входы не
+    менялись с прошлого объединения, пропускаются (force — объединить заново).
+    Возвращает {кабинет: число строк}.
+    """
+    accounts = list(accounts or ACCOUNTS)
+
+    current = manifest.versions([k for a in accounts for k in (orders_key(a), nobuy_key(a))] + [DATABASE_KEY])
+    inputs = {a: {k: current[k] for k in (orders_key(a), nobuy_key(a), DATABASE_KEY)} for a in accounts}
+
+    results: dict[str, int] = {}
+    unchanged = set()
+    if not force:
+        for a in accounts:
+            prev = manifest.fresh(stage_name(a), inputs[a])
+            if prev is not None:
+                results[a] = prev["result"]
+                unchanged.add(a)
+    todo = [a for a in accounts if a not in unchanged]
+
+    failed: dict[str, Exception] = {}
+    ready = []
+    if todo:
+        # база — один раз на весь проход, до запуска потоков
+        load_barcode_table()
+
+        errors: dict[str, Exception] = {}
+        keys = [k for a in todo for k in (orders_key(a), nobuy_key(a))]
+        frames = s3_read_frames(keys, errors=errors)
+
+        for a in todo:
+            missing = [k for k in (orders_key(a), nobuy_key(a)) if k in errors]
+            if missing:
+                failed[a] = RuntimeError(f"не удалось прочитать {', '.join(missing)}: {errors[missing[0]]}")
+            else:
+                ready.append(a)
+
+    if ready:
+        with ThreadPoolExecutor(max_workers=len(ready)) as pool:
+            futures = {a: pool.submit(_merge_and_save, a, frames, inputs[a]) for a in ready}
+            for a, f in futures.items():
+                try:
+                    results[a] = f.result()
+                except Exception as e:
+                    failed[a] = e
+
+    for a in accounts:
+        if a in unchanged:
+            print(f"{a}: без изменений — {results[a]} строк (s3://{s3_bucket()}/{merged_key(a)})")
+        elif a in results:
+            print(f"{a}: {results[a]} строк → s3://{s3_bucket()}/{merged_key(a)}")
+        else:
+            print(f"{a}: ОШИБКА — {failed[a]}")
+
+    if failed:
+        raise RuntimeError(f"Не удалось объединить с базой кабинеты: {', '.join(failed)}")
+    return results
+
+
+if __name__ == "__main__":
+    # python merge_engine.py [A D ...]
+    try:
+        run(sys.argv[1:] or None)
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        raise
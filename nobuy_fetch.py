@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+ID сборочных заданий из поставок 'НЕ КУПИЛИ' (/supplies/{id}/order-ids).
+
+Поставки опрашиваются параллельно в ограниченном пуле, каждый запрос с
+таймаутом и повтором на 429/5xx. Если часть поставок так и не ответила,
+файл всё равно пишется по тем, что получены, а неудачные перечисляются в логе.
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from accounts import SELLERS, api_key, nobuy_key
+from order_ids import format_report, order_id_report, order_id_series
+from s3_storage import s3_bucket, s3_write_frame
+from wb_api import MARKETPLACE_URL, make_session, request
+
+ORDER_IDS_URL = f"{MARKETPLACE_URL}/api/marketplace/v3/supplies/{{supplyId}}/order-ids"
+
+MAX_WORKERS = 6
+REQUEST_TIMEOUT = 30
+
+
+def get_order_ids(session, account: str, supply_id: str) -> list[int]:
+    resp = request(session, "GET", ORDER_IDS_URL.format(supplyId=supply_id),
+                   account=account, timeout=REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json().get('orderIds', [])
+
+
+def fetch_many(account: str, supply_ids) -> tuple[dict[str, list[int]], dict[str, Exception]]:
+    """Возвращает ({поставка: [ID заданий]}, {поставка: ошибка}) в порядке supply_ids."""
+    supply_ids = [s.strip() for s in supply_ids if s and s.strip()]
+    session = make_session(api_key(account), pool_size=MAX_WORKERS)
+
+    def _one(supply_id):
+        try:
+            return supply_id, get_order_ids(session, account, supply_id), None
+        except Exception as e:
+            return supply_id, None, e
+
+    found, failed = {}, {}
+    if not supply_ids:
+        return found, failed
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(supply_ids))) as pool:
+        for supply_id, ids, err in pool.map(_one, supply_ids):
+            if err is None:
+                found[supply_id] = ids
+            else:
+                failed[supply_id] = err
+    return found, failed
+
+
+def run_account(account: str, supply_ids, out_key: str | None = None) -> int:
+    if not supply_ids:
+        raise RuntimeError("Не переданы ID поставок")
+
+    found, failed = fetch_many(account, supply_ids)
+
+    rows = []
+    for supply_id, order_ids in found.items():
+        print(f'{supply_id} → {len(order_ids)} заказов')
+        rows.extend({'supply_id': supply_id, 'id': oid} for oid in order_ids)
+    for supply_id, err in failed.items():
+        print(f'⚠️ {supply_id} — не удалось получить заказы: {err}')
+
+    if not found and failed:
+        raise RuntimeError(f"Не удалось получить заказы ни по одной поставке ({len(failed)})")
+
+    df = pd.DataFrame(rows, columns=['supply_id', 'id'])
+    ids = order_id_series(df['id'])
+    report = order_id_report(df['id'], ids)
+    for line in format_report(report):
+        print(line)
+    # задание, попавшее в несколько поставок, оставляем один раз
+    df = df.assign(id=ids)[ids.notna()].drop_duplicates(subset='id').reset_index(drop=True)
+
+    df['Продавец'] = SELLERS[account]
+    df['Группа'] = account
+
+    out_key = out_key or nobuy_key(account)
+    s3_write_frame(df, out_key)
+    print(f"OK: saved to s3://{s3_bucket()}/{out_key}")
+
+    if failed:
+        print(f'Сохранено {len(df)} ID (частично: {len(found)} из {len(found) + len(failed)} поставок) → {out_key}')
+    else:
+        print(f'Сохранено {len(df)} ID → {out_key}')
+    return len(df)
+
+
+if __name__ == '__main__':
+    # python nobuy_fetch.py A <supplyId> [<supplyId> ...]
+    try:
+        run_account(sys.argv[1], sys.argv[2:])
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        raise
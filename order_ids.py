@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Разбор колонки с ID сборочных заданий.
+
+Значения приводятся к nullable Int64 векторно и без прохода через float
+для строк: '123', ' 123 ', '123.0' и 123.0 дают 123, а пустые и мусорные
+значения становятся <NA>. parse_order_ids дополнительно убирает дубликаты
+и возвращает отчёт о том, что было отброшено.
+"""
+import pandas as pd
+from pandas.api.types import is_float_dtype, is_integer_dtype
+
+_TRAILING_ZEROS = r"\.0+$"
+# до 18 цифр — гарантированно помещается в int64
+_DIGITS = r"\d{1,18}"
+
+# сколько отброшенных значений показывать в логе
+REPORT_SAMPLE = 10
+
+
+def order_id_series(col: pd.Series) -> pd.Series:
+    """ID заданий той же длины и с тем же индексом, что col; невалидные — <NA>."""
+    if is_integer_dtype(col.dtype):
+        return col.astype("Int64")
+
+    if is_float_dtype(col.dtype):
+        whole = col.notna() & (col % 1 == 0) & (col >= 0)
+        return col.where(whole).astype("Int64")
+
+    s = col.astype("string").str.strip().str.replace(_TRAILING_ZEROS, "", regex=True)
+    valid = s.str.fullmatch(_DIGITS).fillna(False).astype(bool)
+    out = pd.Series(pd.NA, index=col.index, dtype="Int64")
+    if valid.any():
+        # строка -> Int64 напрямую: точно для любых ID и заметно быстрее pd.to_numeric
+        out[valid] = s[valid].astype("Int64")
+    return out
+
+
+def order_id_report(col: pd.Series, ids: pd.Series) -> dict:
+    """
+    Отчёт по разбору col в ids (результат order_id_series):
+    {'total': непустых значений, 'valid': уникальных ID, 'duplicates': повторов,
+     'invalid': число мусорных значений, 'invalid_sample': первые из них}.
+    """
+    good = ids[ids.notna()]
+    unique = good.drop_duplicates()
+
+    # пустые строки — это просто пустые ячейки, а не мусор
+    rest = col[ids.isna() & col.notna()]
+    bad = rest[rest.astype(str).str.strip() != ""]
+
+    return {
+        "total": len(good) + len(bad),
+        "valid": len(unique),
+        "duplicates": len(good) - len(unique),
+        "invalid": len(bad),
+        "invalid_sample": bad.head(REPORT_SAMPLE).tolist(),
+    }
+
+
+def parse_order_ids(col: pd.Series) -> tuple[list[int], dict]:
+    """Уникальные ID в порядке появления и отчёт order_id_report."""
+    ids = order_id_series(col)
+    unique = ids[ids.notna()].drop_duplicates()
+    return unique.astype("int64").tolist(), order_id_report(col, ids)
+
+
+def format_report(report: dict) -> list[str]:
+    """Строки лога о дубликатах и отброшенных значениях (пусто, если всё чисто)."""
+    lines = []
+    if report["duplicates"]:
+        lines.append(f"Повторяющихся ID убрано: {report['duplicates']}")
+    if report["invalid"]:
+        sample = ", ".join(map(str, report["invalid_sample"]))
+        lines.append(f"⚠️ Невалидных ID пропущено: {report['invalid']} (например: {sample})")
+    return lines
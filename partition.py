@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Разбиение таблицы на части по значению колонки и параллельная выгрузка частей в S3.
+
+Таблица делится одним groupby (индексы строк на каждое значение за один
+проход), поэтому стоимость разбиения не зависит от числа пунктов/групп.
+Порядок строк внутри каждой части сохраняется.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from s3_storage import BULK_WORKERS, s3_write_excel
+
+
+def partition(df: pd.DataFrame, key: pd.Series, wanted) -> dict:
+    """{значение: часть df} для значений из wanted (в их порядке); пустые части пропускаются."""
+    positions = df.groupby(key.to_numpy(), sort=False).indices
+    return {w: df.iloc[positions[w]] for w in wanted if w in positions}
+
+
+def export_partitions(parts: dict[str, pd.DataFrame], write=s3_write_excel,
+                      max_workers: int = BULK_WORKERS) -> dict[str, Exception]:
+    """
+    Параллельно пишет {ключ S3: таблица} функцией write(df, key).
+    Возвращает {ключ: ошибка} для неудавшихся (пустой словарь — всё записано).
+    """
+    if not parts:
+        return {}
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(parts))) as pool:
+        futures = {key: pool.submit(write, df, key) for key, df in parts.items()}
+        for key, f in futures.items():
+            try:
+                f.result()
+            except Exception as e:
+                failed[key] = e
+    return failed
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш базы товаров (База данных/База данных.xlsx) для объединения заданий с базой.
+
+Excel из S3 разбирается только когда у объекта сменился ETag: разобранная
+таблица баркод -> (Наименование, Фото, Артикул продавца) лежит локально в Parquet
+и в памяти процесса, так что все шесть merge_with_base и обновление остатков
+делят один разбор.
+"""
+import threading
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+from s3_storage import s3_etag, s3_get_bytes
+
+DATABASE_KEY = "База данных/База данных.xlsx"
+
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+CACHE_FILE = CACHE_DIR / "product_db.parquet"
+ETAG_FILE = CACHE_DIR / "product_db.etag"
+# меняется вместе с набором колонок кэша, чтобы старый Parquet не подхватился
+CACHE_VERSION = "2"
+
+NEED_COLS = ["Баркод", "Наименование", "Фото"]
+ARTICLE_COL = "Артикул продавца"
+MERGE_COLS = ["Наименование", "Фото"]
+
+_lock = threading.Lock()
+_memory: tuple[str, pd.DataFrame] | None = None
+_articles: tuple[str, dict[str, list[str]]] | None = None
+
+
+def build_barcode_table(db_df: pd.DataFrame) -> pd.DataFrame:
+    missing = [c for c in NEED_COLS if c not in db_df.columns]
+    if missing:
+        raise RuntimeError(f"В базе нет колонок: {missing}")
+
+    cols = NEED_COLS + ([ARTICLE_COL] if ARTICLE_COL in db_df.columns else [])
+    db_trimmed = db_df[cols].copy()
+    db_trimmed = db_trimmed.rename(columns={"Баркод": "Штрихкод"})
+
+    db_trimmed["Штрихкод"] = db_trimmed["Штрихкод"].astype(str).str.strip()
+    db_trimmed = db_trimmed.drop_duplicates(subset="Штрихкод")
+    return db_trimmed.set_index("Штрихкод")
+
+
+def _write_cache(table: pd.DataFrame, etag: str):
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        ETAG_FILE.unlink(missing_ok=True)
+        table.to_parquet(CACHE_FILE)
+    except Exception:
+        # нет pyarrow, смешанные типы в колонке (ArrowTypeError), нет доступа к диску —
+        # кэш остаётся только в памяти процесса
+        return
+    ETAG_FILE.write_text(f"{CACHE_VERSION}:{etag}", encoding="utf-8")
+
+
+def _read_cache(etag: str) -> pd.DataFrame | None:
+    try:
+        if ETAG_FILE.read_text(encoding="utf-8").strip() != f"{CACHE_VERSION}:{etag}":
+            return None
+        return pd.read_parquet(CACHE_FILE)
+    except (OSError, ImportError, ValueError):
+        return None
+
+
+def _load(etag: str) -> pd.DataFrame:
+    global _memory
+    if _memory is not None and _memory[0] == etag:
+        return _memory[1]
+
+    table = _read_cache(etag)
+    if table is None:
+        db_df = pd.read_excel(BytesIO(s3_get_bytes(DATABASE_KEY)))
+        table = build_barcode_table(db_df)
+        _write_cache(table, etag)
+        print(f"База данных перечитана из S3 ({len(table)} баркодов)")
+
+    _memory = (etag, table)
+    return table
+
+
+def load_barcode_table() -> pd.DataFrame:
+    """Таблица с индексом 'Штрихкод' и колонками Наименование, Фото (и Артикул продавца, если есть в базе)."""
+    etag = s3_etag(DATABASE_KEY)
+    with _lock:
+        return _load(etag)
+
+
+def load_article_index() -> dict[str, list[str]]:
+    """Артикул продавца -> все его баркоды (строится один раз на версию базы)."""
+    global _articles
+    etag = s3_etag(DATABASE_KEY)
+    with _lock:
+        if _articles is not None and _articles[0] == etag:
+            return _articles[1]
+
+        table = _load(etag)
+        if ARTICLE_COL not in table.columns:
+            raise RuntimeError(f"В базе нет колонки '{ARTICLE_COL}'")
+        articles = table.loc[table[ARTICLE_COL].notna(), ARTICLE_COL].astype(str).str.strip()
+        articles = articles[(articles != "") & ~articles.index.isin(["", "nan"])]
+        index = {a: list(codes) for a, codes in articles.groupby(articles).groups.items()}
+        _articles = (etag, index)
+        return index
+
+
+def attach_names_and_photos(tasks: pd.DataFrame) -> pd.DataFrame:
+    """Добавляет к заданиям Наименование и Фото по Штрихкоду (аналог merge how='left')."""
+    if "Штрихкод" not in tasks.columns:
+        raise RuntimeError("В таблице заданий/НЕ КУПИЛИ нет колонки 'Штрихкод'")
+    tasks = tasks.copy()
+    tasks["Штрихкод"] = tasks["Штрихкод"].astype(str).str.strip()
+    return tasks.join(load_barcode_table()[MERGE_COLS], on="Штрихкод")
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Регионы закупки: файл ЗАДАНИЯ_* из orders/готовые, папка закупленных и имя поставки."""
+
+# регион -> (ЗАДАНИЯ_* в orders/готовые, папка закупленных в S3, префикс имени поставки)
+REGIONS = {
+    "krd": ("orders/готовые/ЗАДАНИЯ_КРАСНОДАР.xlsx", "закупленные/закупленные_Краснодар", "ЗАКУПЛЕННЫЕ КРД"),
+    "msk": ("orders/готовые/ЗАДАНИЯ_МОСКВА.xlsx", "закупленные/закупленные_Москва", "ЗАКУПЛЕННЫЕ МОСКВА"),
+    "kal": ("orders/готовые/ЗАДАНИЯ_КАЛЕДИНО.xlsx", "закупленные/закупленные_Каледино", "ЗАКУПЛЕННЫЕ КАЛЕДИНО"),
+    "ekb": ("orders/готовые/ЗАДАНИЯ_ЕКБ.xlsx", "закупленные/закупленные_Екб", "ЗАКУПЛЕННЫЕ ЕКБ"),
+}
+
+
+def tasks_key(region: str) -> str:
+    return REGIONS[region][0]
+
+
+def bought_key(region: str, group: str) -> str:
+    return f"{REGIONS[region][1]}/{group}.xlsx"
+
+
+def supply_name_prefix(region: str) -> str:
+    return REGIONS[region][2]
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+Общий слой доступа к S3 (Yandex Object Storage) для всех скриптов пайплайна.
+
+Клиент boto3 создаётся один раз на процесс и переиспользуется всеми
+чтениями/записями: пул соединений держит TLS-сессии тёплыми, а пакетные
+s3_get_many / s3_put_many гоняют запросы параллельно через тот же пул.
+"""
+import os
+import json
+import threading
+from io import BytesIO
+from urllib.parse import quote
+from tempfile import SpooledTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.client import Config
+from botocore.exceptions import ClientError
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Пул соединений должен быть не меньше числа потоков в пакетных операциях,
+# иначе urllib3 начнёт выбрасывать лишние соединения и снова делать handshake.
+MAX_POOL_CONNECTIONS = 32
+BULK_WORKERS = 16
+
+# Книга до 32 МБ собирается в памяти, больше — сбрасывается во временный файл.
+# Файлы крупнее порога уходят в S3 multipart-загрузкой частями по 8 МБ.
+XLSX_SPOOL_MAX = 32 * 1024 * 1024
+XLSX_CHUNK_ROWS = 10_000
+# Промежуточные таблицы пайплайна хранятся как Parquet-снимки рядом с
+# ключом .xlsx (тот же путь, расширение .parquet). Excel для них пишется,
+# только если YC_S3_INTERMEDIATE_XLSX=1 — для файлов, которые открывают люди,
+# xlsx пишется всегда, а снимок помечается ETag'ом этого xlsx. Снимок без xlsx
+# помечается SOURCE_ABSENT: xlsx, появившийся под ключом позже, новее снимка.
+SNAPSHOT_EXT = ".parquet"
+SOURCE_ETAG_META = "source-etag"
+SOURCE_ABSENT = "-"
+INTERMEDIATE_XLSX = (os.environ.get("YC_S3_INTERMEDIATE_XLSX") or "").strip() == "1"
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _must(name: str) -> str:
+    v = (os.environ.get(name) or "").strip()
+    if not v:
+        raise RuntimeError(f"Missing env var: {name}")
+    return v
+
+
+def s3_client():
+    """Возвращает общий для процесса клиент S3 (создаётся при первом вызове)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.client(
+                    "s3",
+                    endpoint_url=_must("YC_S3_ENDPOINT"),
+                    aws_access_key_id=_must("YC_S3_KEY_ID"),
+                    aws_secret_access_key=_must("YC_S3_SECRET"),
+                    region_name=(os.environ.get("YC_S3_REGION") or "").strip() or None,
+                    config=Config(
+                        signature_version="s3v4",
+                        max_pool_connections=MAX_POOL_CONNECTIONS,
+                        connect_timeout=10,
+                        read_timeout=120,
+                        retries={"max_attempts": 5, "mode": "standard"},
+                        tcp_keepalive=True,
+                    ),
+                )
+    return _client
+
+
+def reset_s3_client():
+    """Сбрасывает общий клиент (например, после смены ключей в окружении)."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def s3_bucket() -> str:
+    return _must("YC_S3_BUCKET")
+
+
+def s3_list_etags(prefix: str) -> dict[str, str]:
+    """{key: ETag} всех объектов под префиксом (ETag приходит в листинге бесплатно)."""
+    etags = {}
+    token = None
+    client = s3_client()
+    bucket = s3_bucket()
+    while True:
+        kwargs = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": 1000}
+        if token:
+            kwargs["ContinuationToken"] = token
+        resp = client.list_objects_v2(**kwargs)
+        for obj in resp.get("Contents", []) or []:
+            k = obj.get("Key", "")
+            if k and not k.endswith("/"):
+                etags[k] = obj.get("ETag", "").strip('"')
+        if resp.get("IsTruncated"):
+            token = resp.get("NextContinuationToken")
+        else:
+            break
+    return etags
+
+
+def s3_list_keys(prefix: str) -> list[str]:
+    return list(s3_list_etags(prefix))
+
+
+def s3_get_bytes(key: str) -> bytes:
+    obj = s3_client().get_object(Bucket=s3_bucket(), Key=key)
+    return obj["Body"].read()
+
+
+def s3_put_bytes(key: str, data: bytes, content_type: str):
+    s3_client().put_object(
+        Bucket=s3_bucket(),
+        Key=key,
+        Body=data,
+        ContentType=content_type,
+    )
+
+
+def s3_presigned_url(key: str, expires: int = 3600, filename: str | None = None) -> str:
+    """Временная ссылка на скачивание объекта напрямую из S3 (подписывается локально, без запроса)."""
+    params = {"Bucket": s3_bucket(), "Key": key}
+    if filename:
+        params["ResponseContentDisposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return s3_client().generate_presigned_url("get_object", Params=params, ExpiresIn=expires)
+
+
+def s3_etag(key: str) -> str:
+    """ETag объекта без скачивания тела (HEAD)."""
+    return s3_client().head_object(Bucket=s3_bucket(), Key=key)["ETag"].strip('"')
+
+
+def _head_or_none(key: str) -> dict | None:
+    """HEAD объекта; None, если его нет."""
+    try:
+        return s3_client().head_object(Bucket=s3_bucket(), Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+def s3_get_json(key: str, default=None):
+    """Читает JSON-объект; если ключа нет — возвращает default."""
+    try:
+        return json.loads(s3_get_bytes(key).decode("utf-8"))
+    except s3_client().exceptions.NoSuchKey:
+        return default
+
+
+def s3_put_json(key: str, obj):
+    s3_put_bytes(key, json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json")
+
+
+def s3_read_excel(key: str) -> pd.DataFrame:
+    return pd.read_excel(BytesIO(s3_get_bytes(key)))
+
+
+def write_xlsx(df: pd.DataFrame, fileobj):
+    """
+    Пишет таблицу в xlsx в режиме openpyxl write_only: строки уходят в книгу
+    потоком, без дерева ячеек в памяти. Заголовок жирный, без индекса (как df.to_excel).
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+
+    header = []
+    for name in df.columns:
+        cell = WriteOnlyCell(ws, value=str(name))
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+
+    # NaN/NaT -> пустая ячейка; кусками, чтобы не копировать всю таблицу в object разом
+    for start in range(0, len(df), XLSX_CHUNK_ROWS):
+        chunk = df.iloc[start:start + XLSX_CHUNK_ROWS].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append(row)
+
+    wb.save(fileobj)
+
+
+def s3_upload_fileobj(key: str, fileobj, content_type: str):
+    """Загрузка из файлового объекта; крупные файлы идут multipart параллельными частями."""
+    s3_client().upload_fileobj(
+        fileobj,
+        s3_bucket(),
+        key,
+        ExtraArgs={"ContentType": content_type},
+        Config=TRANSFER_CONFIG,
+    )
+
+
+def s3_write_excel(df: pd.DataFrame, key: str):
+    with SpooledTemporaryFile(max_size=XLSX_SPOOL_MAX) as tmp:
+        write_xlsx(df, tmp)
+        tmp.seek(0)
+        s3_upload_fileobj(key, tmp, XLSX_CONTENT_TYPE)
+
+
+def snapshot_key(key: str) -> str:
+    return os.path.splitext(key)[0] + SNAPSHOT_EXT
+
+
+def _snapshot_bytes(df: pd.DataFrame) -> bytes:
+    buf = BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+def _put_snapshot(df: pd.DataFrame, key: str, source_etag: str, body: bytes | None = None):
+    s3_client().put_object(
+        Bucket=s3_bucket(),
+        Key=snapshot_key(key),
+        Body=body if body is not None else _snapshot_bytes(df),
+        ContentType="application/vnd.apache.parquet",
+        Metadata={SOURCE_ETAG_META: source_etag},
+    )
+
+
+def s3_delete(key: str):
+    s3_client().delete_object(Bucket=s3_bucket(), Key=key)
+
+
+def s3_write_frame(df: pd.DataFrame, key: str, excel: bool | None = None):
+    """
+    Сохраняет таблицу стадии пайплайна под логическим ключом key (.xlsx).
+    excel=True — xlsx для людей плюс снимок с его ETag; excel=False — только снимок,
+    а xlsx, оставшийся под ключом от прежних запусков, удаляется; None — по настройке
+    INTERMEDIATE_XLSX. Если таблицу нельзя сохранить в Parquet (смешанные типы
+    в колонке, нет pyarrow), пишется обычный xlsx.
+    """
+    if excel is None:
+        excel = INTERMEDIATE_XLSX
+
+    if excel:
+        s3_write_excel(df, key)
+        try:
+            _put_snapshot(df, key, s3_etag(key))
+        except Exception as e:
+            # старый снимок помечен другим ETag (или SOURCE_ABSENT) и читаться не будет
+            print(f"⚠️ Не удалось записать снимок {snapshot_key(key)}, читаться будет xlsx: {e}")
+        return
+
+    try:
+        body = _snapshot_bytes(df)
+    except Exception:
+        s3_write_excel(df, key)
+        s3_delete(snapshot_key(key))
+        return
+
+    # устаревший xlsx в бакете выглядел бы актуальным; не удалился — снимок
+    # помечается его ETag, и замена xlsx вручную всё равно будет замечена
+    try:
+        s3_delete(key)
+        source = SOURCE_ABSENT
+    except Exception as e:
+        print(f"⚠️ Не удалось удалить устаревший {key}: {e}")
+        head = _head_or_none(key)
+        source = head["ETag"].strip('"') if head else SOURCE_ABSENT
+    _put_snapshot(df, key, source, body)
+
+
+def _read_snapshot(key: str) -> pd.DataFrame | None:
+    """
+    Снимок, если он есть и не устарел относительно xlsx под key: xlsx с другим ETag
+    или появившийся после снимка без xlsx (залили вручную, старым скриптом) — новее.
+    Снимки без пометки (до SOURCE_ABSENT) сверяются с xlsx по времени изменения.
+    """
+    try:
+        obj = s3_client().get_object(Bucket=s3_bucket(), Key=snapshot_key(key))
+    except s3_client().exceptions.NoSuchKey:
+        return None
+
+    source_etag = obj.get("Metadata", {}).get(SOURCE_ETAG_META, "")
+    try:
+        head = _head_or_none(key)
+    except Exception:
+        return None
+    if head is not None:
+        if source_etag == SOURCE_ABSENT:
+            return None
+        if source_etag and head["ETag"].strip('"') != source_etag:
+            return None
+        if not source_etag and head["LastModified"] > obj["LastModified"]:
+            return None
+    try:
+        return pd.read_parquet(BytesIO(obj["Body"].read()))
+    except Exception:
+        return None
+
+
+def s3_read_frame(key: str) -> pd.DataFrame:
+    """Читает таблицу стадии: сначала Parquet-снимок, иначе сам xlsx под key."""
+    df = _read_snapshot(key)
+    if df is not None:
+        return df
+    return s3_read_excel(key)
+
+
+def s3_read_frames(keys, max_workers: int = BULK_WORKERS, errors: dict | None = None) -> dict[str, pd.DataFrame]:
+    """Параллельный s3_read_frame. Ошибки — как в s3_get_many."""
+    keys = list(keys)
+    if not keys:
+        return {}
+
+    def _read(key):
+        try:
+            return key, s3_read_frame(key), None
+        except Exception as e:
+            return key, None, e
+
+    result = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as pool:
+        for key, df, err in pool.map(_read, keys):
+            if err is None:
+                result[key] = df
+            elif errors is not None:
+                errors[key] = err
+            else:
+                raise err
+    return result
+
+
+def s3_get_many(keys, max_workers: int = BULK_WORKERS, errors: dict | None = None) -> dict[str, bytes]:
+    """
+    Параллельно скачивает объекты. Возвращает {key: bytes} в порядке keys.
+    Если передан словарь errors — ошибки складываются туда {key: exception},
+    иначе первая ошибка пробрасывается.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+
+    def _get(key):
+        try:
+            return key, s3_get_bytes(key), None
+        except Exception as e:
+            return key, None, e
+
+    result = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as pool:
+        for key, data, err in pool.map(_get, keys):
+            if err is None:
+                result[key] = data
+            elif errors is not None:
+                errors[key] = err
+            else:
+                raise err
+    return result
+
+
+def s3_put_many(items, max_workers: int = BULK_WORKERS):
+    """
+    Параллельно загружает объекты. items — итерируемое из (key, data, content_type).
+    Пробрасывает первую ошибку после завершения всех загрузок.
+    """
+    items = list(items)
+    if not items:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        futures = [pool.submit(s3_put_bytes, key, data, ct) for key, data, ct in items]
+        for f in futures:
+            f.result()
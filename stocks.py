@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Массовое обновление остатков FBS: PUT /api/v3/stocks/{warehouseId}.
+
+На входе таблица строк (артикул или баркод, склад, остаток). Артикулы
+раскрываются во все баркоды по индексу базы товаров (product_db, кэш по ETag),
+обновления собираются по складам и уходят пачками по 1000 SKU; пачки всех
+складов идут параллельно в пределах лимитера кабинета. Если WB отвечает 409
+и перечисляет SKU с ошибкой, они откладываются, а остальные отправляются
+повторно; без перечня пачка на 400/409 делится пополам вплоть до отдельных SKU
+(как в supply_builder, в пределах SPLIT_BUDGET запросов на пачку).
+"""
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from accounts import api_key
+from jobs import check_cancelled, progress
+from product_db import ARTICLE_COL, load_article_index, load_barcode_table
+from wb_api import CONFLICT_COST, CONTENT_URL, MARKETPLACE_URL, limiter_for, make_session, request
+
+STOCKS_URL = f"{MARKETPLACE_URL}/api/v3/stocks/{{warehouseId}}"
+CARDS_URL = f"{CONTENT_URL}/content/v2/get/cards/list"
+
+# карточки кабинета: до 100 за запрос, квота Content API — 100 запросов в минуту
+CARDS_PAGE = 100
+CARDS_RATE = 100 / 60
+CARDS_BURST = 5
+
+ITEM_COL = "Артикул или баркод"
+WAREHOUSE_COL = "Склад"
+AMOUNT_COL = "Остаток"
+
+CHUNK_SIZE = 1000
+MAX_WORKERS = 4
+MAX_AMOUNT = 100_000
+# делим пачку без перечня плохих SKU только на этих статусах
+SPLIT_STATUSES = {400, 409}
+# запросов на разбор одной отклонённой пачки; остаток после исчерпания — ошибка
+SPLIT_BUDGET = 160
+
+
+def plan(rows: pd.DataFrame, warehouses: dict[str, str] | None = None) -> tuple[dict[str, dict[str, int]], list[str]]:
+    """
+    Раскрывает строки в {ID склада: {баркод: остаток}}. Возвращает (план, проблемы).
+    warehouses — названия складов кабинета -> ID, чтобы в таблице можно было писать названия.
+    Повтор баркода на одном складе: побеждает последняя строка.
+    """
+    missing = [c for c in (ITEM_COL, WAREHOUSE_COL, AMOUNT_COL) if c not in rows.columns]
+    if missing:
+        raise RuntimeError(f"В таблице нет колонок: {missing}")
+
+    warehouses = warehouses or {}
+    barcodes = load_barcode_table().index
+    articles = load_article_index()
+
+    result: dict[str, dict[str, int]] = {}
+    problems: list[str] = []
+    for n, (item, warehouse, amount) in enumerate(
+            rows[[ITEM_COL, WAREHOUSE_COL, AMOUNT_COL]].itertuples(index=False, name=None), start=2):
+        item = "" if pd.isna(item) else str(item).strip().removesuffix(".0")
+        name = "" if pd.isna(warehouse) else str(warehouse).strip().removesuffix(".0")
+        warehouse = warehouses.get(name, name)
+        if not item:
+            continue
+        if not warehouse.isdigit():
+            problems.append(f"Строка {n}: неизвестный склад '{name}'")
+            continue
+        try:
+            value = float(amount)
+            amount = int(value)
+        except (TypeError, ValueError, OverflowError):
+            problems.append(f"Строка {n}: остаток не число ({amount!r})")
+            continue
+        if amount != value:
+            problems.append(f"Строка {n}: остаток не целый ({value:g})")
+            continue
+        if not 0 <= amount <= MAX_AMOUNT:
+            problems.append(f"Строка {n}: остаток вне 0…{MAX_AMOUNT} ({amount})")
+            continue
+
+        if item in articles:
+            skus = articles[item]
+        elif item in barcodes or item.isdigit():
+            skus = [item]
+        else:
+            problems.append(f"Строка {n}: '{item}' не найден в базе")
+            continue
+        stocks = result.setdefault(warehouse, {})
+        for sku in skus:
+            stocks[sku] = amount
+    return result, problems
+
+
+def _conflict_skus(resp) -> set[str]:
+    try:
+        return {str(item["sku"]) for item in resp.json().get("data", []) or [] if "sku" in item}
+    except Exception:
+        return set()
+
+
+def _put_once(session, account: str, warehouse: str, chunk: dict[str, int]) -> tuple[int | None, str, set[str]]:
+    """Одна попытка. Возвращает (HTTP-статус или None, причина, SKU, которые WB назвал в 409)."""
+    body = {"stocks": [{"sku": sku, "amount": amount} for sku, amount in chunk.items()]}
+    try:
+        resp = request(session, "PUT", STOCKS_URL.format(warehouseId=warehouse), account=account,
+                       json=body, timeout=30)
+    except Exception as e:
+        return None, str(e), set()
+    if resp.status_code == 409:
+        limiter_for(account).charge(CONFLICT_COST - 1)
+        return 409, f"409 — {resp.text}", _conflict_skus(resp) & set(chunk)
+    return resp.status_code, f"{resp.status_code} — {resp.text}", set()
+
+
+def _resolve(session, account: str, warehouse: str, chunk: dict[str, int],
+             status: int | None, reason: str, bad: set[str]) -> tuple[list[str], dict[str, str]]:
+    """
+    Разбирает отклонённую пачку. SKU из 409 откладываются, остальное отправляется заново;
+    400/409 без перечня SKU делятся пополам вплоть до отдельных SKU. 401/403/404 и прочее —
+    вся пачка. Как в supply_builder: в ширину, не больше SPLIT_BUDGET запросов.
+    """
+    ok: list[str] = []
+    failed: dict[str, str] = {}
+    budget = SPLIT_BUDGET
+    pending = deque([(chunk, status, reason, bad)])
+    while pending:
+        part, status, reason, bad = pending.popleft()
+        if bad:
+            failed.update((s, reason) for s in bad)
+            part = {s: a for s, a in part.items() if s not in bad}
+            parts = [part] if part else []
+        elif status not in SPLIT_STATUSES or len(part) == 1:
+            failed.update((s, reason) for s in part)
+            continue
+        else:
+            items = list(part.items())
+            parts = [dict(items[:len(items) // 2]), dict(items[len(items) // 2:])]
+
+        if budget < len(parts):
+            failed.update((s, f"{reason} (пачка не разобрана: исчерпан лимит {SPLIT_BUDGET} запросов)")
+                          for p in parts for s in p)
+            continue
+        for p in parts:
+            s, r, b = _put_once(session, account, warehouse, p)
+            budget -= 1
+            if s == 204:
+                ok += list(p)
+            else:
+                pending.append((p, s, r, b))
+    return ok, failed
+
+
+def _put(session, account: str, warehouse: str, chunk: dict[str, int]) -> tuple[list[str], dict[str, str]]:
+    """Отправляет пачку одного склада. Возвращает (обновлённые, {sku: причина})."""
+    status, reason, bad = _put_once(session, account, warehouse, chunk)
+    if status == 204:
+        return list(chunk), {}
+    return _resolve(session, account, warehouse, chunk, status, reason, bad)
+
+
+def barcode_articles(barcodes: pd.Series) -> pd.Series:
+    """Артикул продавца для каждого баркода по базе товаров ('' — нет в базе или база недоступна)."""
+    try:
+        table = load_barcode_table()
+    except Exception as e:
+        print(f"⚠️ Артикулы для отчёта не подтянуты: {e}")
+        table = pd.DataFrame()
+    if ARTICLE_COL not in table.columns:
+        return pd.Series("", index=barcodes.index)
+    articles = table[ARTICLE_COL].reindex(barcodes.astype(str))
+    return pd.Series([
+        "" if pd.isna(a) else str(a).strip().removesuffix(".0") for a in articles
+    ], index=barcodes.index)
+
+
+def account_barcodes(session, account: str) -> list[str]:
+    """Все баркоды карточек кабинета (Content API, курсором по CARDS_PAGE карточек)."""
+    limiter = limiter_for(f"content:{account}", CARDS_RATE, CARDS_BURST)
+    barcodes: dict[str, None] = {}
+    cursor = {"limit": CARDS_PAGE}
+    while True:
+        limiter.acquire()
+        resp = request(session, "POST", CARDS_URL, timeout=60,
+                       json={"settings": {"cursor": cursor, "filter": {"withPhoto": -1}}})
+        if resp.status_code != 200:
+            raise RuntimeError(f"Не удалось получить карточки кабинета: {resp.status_code} — {resp.text}")
+        body = resp.json() or {}
+        for card in body.get("cards", []) or []:
+            for size in card.get("sizes", []) or []:
+                barcodes.update(dict.fromkeys(str(s).strip() for s in size.get("skus", []) or [] if s))
+        page = body.get("cursor") or {}
+        if page.get("total", 0) < CARDS_PAGE or not page.get("nmID"):
+            return list(barcodes)
+        cursor = {"limit": CARDS_PAGE, "updatedAt": page.get("updatedAt"), "nmID": page.get("nmID")}
+
+
+def send(session, account: str, stocks_plan: dict[str, dict[str, int]],
+         chunk_size: int = CHUNK_SIZE) -> dict[str, tuple[list[str], dict[str, str]]]:
+    """Отправляет план параллельно. Возвращает {склад: (обновлённые, {sku: причина})}."""
+    chunks = []
+    for warehouse, stocks in stocks_plan.items():
+        items = list(stocks.items())
+        chunks += [(warehouse, dict(items[i:i + chunk_size])) for i in range(0, len(items), chunk_size)]
+
+    result = {w: ([], {}) for w in stocks_plan}
+    if not chunks:
+        return result
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(chunks))) as pool:
+        futures = {pool.submit(_put, session, account, w, c): w for w, c in chunks}
+        for done, f in enumerate(as_completed(futures), start=1):
+            warehouse = futures[f]
+            ok, failed = f.result()
+            result[warehouse][0].extend(ok)
+            result[warehouse][1].update(failed)
+            print(f"Склад {warehouse}: пачка — обновлено {len(ok)}, ошибок {len(failed)}")
+            progress(done, len(futures))
+            check_cancelled(futures)
+    return result
+
+
+def _session(account: str):
+    token = api_key(account)
+    if not token:
+        raise RuntimeError(f"Missing API_{account} in st.secrets")
+    return make_session(token, pool_size=MAX_WORKERS)
+
+
+def run(account: str, rows: pd.DataFrame, warehouses: dict[str, str] | None = None,
+        session=None) -> pd.DataFrame:
+    """
+    Обновляет остатки по таблице строк. Возвращает отчёт по баркодам:
+    Склад, Баркод, Остаток, Статус ('ok' / 'error'), Причина, Артикул продавца.
+    """
+    stocks_plan, problems = plan(rows, warehouses)
+    for line in problems:
+        print(f"⚠️ {line}")
+    return run_plan(account, stocks_plan, session)
+
+
+def run_plan(account: str, stocks_plan: dict[str, dict[str, int]], session=None) -> pd.DataFrame:
+    """Отправляет готовый план {склад: {баркод: остаток}} и собирает отчёт (см. run)."""
+    session = session or _session(account)
+    total = sum(len(s) for s in stocks_plan.values())
+    if not total:
+        raise RuntimeError("Нечего обновлять: ни одна строка не дала баркодов")
+    print(f"К отправке: {total} SKU на {len(stocks_plan)} склад(ах)")
+
+    sent = send(session, account, stocks_plan)
+
+    report = []
+    for warehouse, (ok, failed) in sent.items():
+        stocks = stocks_plan[warehouse]
+        report += [(warehouse, sku, stocks[sku], "ok", "") for sku in ok]
+        report += [(warehouse, sku, stocks[sku], "error", reason) for sku, reason in failed.items()]
+        print(f"{'✅' if not failed else '⚠️'} Склад {warehouse}: обновлено {len(ok)}/{len(stocks)}")
+    report = pd.DataFrame(report, columns=[WAREHOUSE_COL, "Баркод", AMOUNT_COL, "Статус", "Причина"])
+    report[ARTICLE_COL] = barcode_articles(report["Баркод"])
+    return report
+
+
+def zero_warehouse(account: str, warehouse: str, session=None) -> pd.DataFrame:
+    """Обнуляет на складе весь ассортимент кабинета — баркоды его карточек, а не всю базу."""
+    session = session or _session(account)
+    barcodes = account_barcodes(session, account)
+    print(f"Карточки кабинета {account}: {len(barcodes)} баркодов")
+    return run_plan(account, {warehouse: dict.fromkeys(barcodes, 0)}, session)
+
+
+if __name__ == "__main__":
+    # python stocks.py A остатки.xlsx   (колонки: Артикул или баркод, Склад, Остаток)
+    try:
+        report = run(sys.argv[1], pd.read_excel(sys.argv[2]))
+        failed = report[report["Статус"] != "ok"]
+        for row in failed.itertuples(index=False):
+            print(f"❌ {row[0]} / {row[1]}: {row[4]}")
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        raise
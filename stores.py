@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Префиксы артикула продавца -> магазин закупки (колонка 'Магазин'), общие для всех кабинетов."""
+import pandas as pd
+
+BASE_PREFIX_TO_SUPPLY = {
+    'TAB': 'ТАБРИС',
+    'TBRS': 'ТАБРИС',
+    'BAU': 'БАУЦЕНТР',
+    'MK': 'КОСМЕТИК',
+    'mk': 'КОСМЕТИК',
+    'YEMKP': 'КОСМЕТИК',
+    'MGKSMT': 'КОСМЕТИК',
+    'OKK': 'ОКЕЙ',
+    'EA': 'МОСКВА АПТЕКА',
+    'ASIA': 'АЗИЯЛЭНД',
+    'TURC': 'ТУРЦИЯ',
+    'MAG': 'МАГНИТ',
+    'CHIT': 'ЧИТАЙГОРОД',
+    'LEMAN': 'ЛЕМАНА',
+    'LETOILE': 'ЛЕТУАЛЬ',
+    'ZOOZAVR': 'ЗООЗАВР',
+    'hlorid': 'МОСКВА ХЛОРИД',
+    'AUCHAN': 'АШАН',
+    'ACH'   : 'АШАН',
+    'HUNT': 'МИРОХОТЫ',
+    'MIR':  'МИРОХОТЫ',
+    'MTR': 'МЕТРО',
+    'MET': 'МЕТРО',
+    'MODI': 'МОДИ',
+    'PDRGT': 'ПИДРУЖКА',
+    'TOK': 'ТОКПОКА',
+    '4LAPY' : 'ЛАПЫ',
+    'LENTA': 'ЛЕНТА',
+    'PEREK': 'ПЕРЕКРЁСТОК',
+    'PDRG': 'ПОДРУЖКА',
+}
+
+# отличия кабинетов от общей таблицы: (добавить/переопределить, убрать)
+_ACCOUNT_OVERRIDES = {
+    "A": ({}, ()),
+    "B": ({
+        'nivea': 'ОКЕЙ',
+        'wb4lxltrsh': 'ОКЕЙ',
+        'Kofe 123':   'ОКЕЙ',
+        'Lime':       'ОКЕЙ',
+    }, ('PDRGT',)),
+    "C": ({'wb4lxltrsh': 'ОКЕЙ'}, ()),
+    "D": ({
+        'BRIZ': 'ТАБРИС',
+        'LKOS': 'КОСМЕТИК',
+        'CROSS': 'ПЕРЕКРЕСТОК',
+        'PEREK': 'ПЕРЕКРЕСТОК',
+    }, ()),
+    "E": ({
+        'wb4lxltrsh': 'ОКЕЙ',
+        'BRIZ': 'ТАБРИС',
+        'LKOS': 'КОСМЕТИК',
+        'CROSS': 'ПЕРЕКРЕСТОК',
+        'PEREK': 'ПЕРЕКРЕСТОК',
+    }, ()),
+    "F": ({'wb4lxltrsh': 'ОКЕЙ'}, ()),
+}
+
+
+def prefix_table(account: str) -> dict[str, str]:
+    extra, drop = _ACCOUNT_OVERRIDES.get(account, ({}, ()))
+    table = {k: v for k, v in BASE_PREFIX_TO_SUPPLY.items() if k not in drop}
+    table.update(extra)
+    return table
+
+
+class PrefixMatcher:
+    """
+    Побеждает самый длинный подходящий префикс, поэтому результат не зависит
+    от порядка ключей в таблице (PDRGT/PDRG, MK/mk/MGKSMT и т.п.).
+    match() идёт по trie за O(len(article)), classify() размечает целую колонку.
+    """
+
+    def __init__(self, prefix_to_supply: dict[str, str]):
+        self.table = dict(prefix_to_supply)
+        self._trie: dict = {}
+        for prefix, store in self.table.items():
+            node = self._trie
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node[None] = store
+        # для classify: префиксы, сгруппированные по длине, от длинных к коротким
+        by_len: dict[int, dict[str, str]] = {}
+        for prefix, store in self.table.items():
+            by_len.setdefault(len(prefix), {})[prefix] = store
+        self._by_len = sorted(by_len.items(), reverse=True)
+
+    def match(self, article) -> str:
+        if not isinstance(article, str):
+            return ''
+        node, found = self._trie, ''
+        for ch in article:
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                found = node[None]
+        return found
+
+    def classify(self, articles: pd.Series) -> pd.Series:
+        s = articles.astype("string")
+        result = pd.Series(pd.NA, index=s.index, dtype="string")
+        for length, table in self._by_len:
+            hit = s.str.slice(0, length).map(table)
+            result = result.fillna(hit)
+        return result.fillna('').astype(object)
+
+
+MATCHERS = {acc: PrefixMatcher(prefix_table(acc)) for acc in _ACCOUNT_OVERRIDES}
+
+
+def matcher_for(account: str) -> PrefixMatcher:
+    return MATCHERS[account]
+
+
+def get_magazin_by_article(article, account: str) -> str:
+    return MATCHERS[account].match(article)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Список активных (незавершённых) поставок кабинета: /api/v3/supplies.
+
+WB отдаёт поставки страницами от старых к новым и возвращает курсор next.
+Идём по курсору до конца, а в S3 (supplies/state/{X}.json) запоминаем
+курсор начала последней страницы, завершённые поставки с этой страницы и текущие
+активные. Следующее обновление начинает с этого курсора, а ранее активные
+поставки, которые не попали в свежие страницы, перепроверяет точечно.
+Таблица supplies/active/{X}.xlsx перезаписывается, только если она изменилась.
+run() обновляет все кабинеты параллельно и сразу отдаёт таблицы вызывающему.
+"""
+import sys
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from accounts import ACCOUNTS, api_key
+from s3_storage import s3_bucket, s3_get_json, s3_put_json, s3_write_frame
+from wb_api import MARKETPLACE_URL, make_session, request
+
+SUPPLIES_URL = f"{MARKETPLACE_URL}/api/v3/supplies"
+SUPPLY_URL = f"{MARKETPLACE_URL}/api/v3/supplies/{{supplyId}}"
+
+PAGE_LIMIT = 1000
+
+
+def active_key(account: str) -> str:
+    return f"supplies/active/{account}.xlsx"
+
+
+def state_key(account: str) -> str:
+    return f"supplies/state/{account}.json"
+
+
+def parse_dt(value: str):
+    if not value:
+        return "", None
+    try:
+        dt = datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+        return dt.strftime("%Y-%m-%d %H:%M:%S"), dt
+    except Exception:
+        return value, None
+
+
+def fetch_supply(session, account: str, supply_id: str) -> dict | None:
+    """Одна поставка по ID; None, если WB её уже не знает (удалена)."""
+    response = request(session, "GET", SUPPLY_URL.format(supplyId=supply_id), account=account, timeout=60)
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise RuntimeError(f"WB error {response.status_code}: {response.text}")
+    return response.json()
+
+
+def fetch_pages(session, account: str, start: int = 0) -> tuple[list[dict], int, list[dict]]:
+    """
+    Все поставки начиная с курсора start.
+    Возвращает (поставки, курсор начала последней страницы, поставки последней страницы).
+    """
+    supplies = []
+    cursor = start
+    while True:
+        response = request(session, "GET", SUPPLIES_URL, account=account,
+                           params={"limit": PAGE_LIMIT, "next": cursor}, timeout=60)
+        if response.status_code != 200:
+            raise RuntimeError(f"WB error {response.status_code}: {response.text}")
+        body = response.json()
+        page = body.get("supplies", []) or []
+        supplies.extend(page)
+        nxt = body.get("next") or 0
+        if len(page) < PAGE_LIMIT or not nxt or nxt == cursor:
+            return supplies, cursor, page
+        cursor = nxt
+
+
+def build_active_frame(supplies: list[dict]) -> pd.DataFrame:
+    rows = []
+    for s in supplies:
+        created_at_str, dt_obj = parse_dt(s.get("createdAt"))
+
+        rows.append({
+            "ID поставки": s.get("id", ""),
+            "Номер поставки": s.get("name", ""),
+            "Дата создания": created_at_str,
+            "_dt_sort": dt_obj,
+            "Завершена": bool(s.get("done", False)),
+            "Тип груза": s.get("cargoType", ""),
+        })
+
+    df = pd.DataFrame(rows)
+
+    if not df.empty:
+        df = df[df["Завершена"] == False]
+
+    if "_dt_sort" in df.columns:
+        df = df.sort_values(by="_dt_sort", ascending=False)
+        df = df.drop(columns=["_dt_sort"])
+
+    return df.reset_index(drop=True)
+
+
+def refresh_account(account: str, full: bool = False) -> tuple[pd.DataFrame, bool, dict]:
+    """
+    Обновляет активные поставки кабинета по сохранённому состоянию.
+    Возвращает (таблица активных поставок, изменилось ли что-то, новое состояние).
+    Состояние не сохраняется: это делает вызывающий после записи таблицы.
+    """
+    key = api_key(account)
+    if not key:
+        raise RuntimeError(f"Missing API_{account} in st.secrets")
+    session = make_session(key)
+
+    state = None if full else s3_get_json(state_key(account))
+    first_run = state is None
+    state = state or {"next": 0, "active": {}, "done": []}
+    done = set(state["done"])
+    old_active: dict[str, dict] = state["active"]
+
+    fetched, last_cursor, last_page = fetch_pages(session, account, state["next"])
+    seen = {s.get("id"): s for s in fetched if s.get("id") not in done}
+
+    # поставки, активные в прошлый раз, но лежащие на уже пройденных страницах
+    for sid in old_active:
+        if sid not in seen:
+            s = fetch_supply(session, account, sid)
+            if s is not None:
+                seen[sid] = s
+
+    active = {}
+    for sid, s in seen.items():
+        if s.get("done"):
+            done.add(sid)
+        else:
+            active[sid] = s
+
+    changed = first_run or active != old_active
+    # следующий запуск начнёт с last_cursor — завершённые с более ранних страниц не понадобятся
+    done &= {s.get("id") for s in last_page}
+    new_state = {"next": last_cursor, "active": active, "done": sorted(done)}
+    return build_active_frame(list(active.values())), changed, new_state
+
+
+def _refresh_and_save(account: str, out_key: str, full: bool) -> tuple[pd.DataFrame, bool]:
+    df, changed, state = refresh_account(account, full=full)
+    # сначала таблица, потом состояние: если запись таблицы упадёт, старое состояние
+    # даст changed в следующий раз и таблица будет записана заново
+    if changed:
+        s3_write_frame(df, out_key)
+    s3_put_json(state_key(account), state)
+    return df, changed
+
+
+def run_account(account: str, out_key: str | None = None, full: bool = False) -> pd.DataFrame:
+    out_key = out_key or active_key(account)
+    df, changed = _refresh_and_save(account, out_key, full)
+
+    if changed:
+        print(f"OK: saved to s3://{s3_bucket()}/{out_key}")
+    else:
+        print(f"Без изменений: s3://{s3_bucket()}/{out_key}")
+    print(f"Rows: {len(df)}")
+    return df
+
+
+def run(accounts=None, full: bool = False, errors: dict | None = None) -> dict[str, pd.DataFrame]:
+    """
+    Обновляет активные поставки всех (или выбранных) кабинетов параллельно.
+    Возвращает {кабинет: таблица}; S3 — только сохранение. Если передан словарь
+    errors — ошибки кабинетов складываются туда, иначе в конце бросается RuntimeError.
+    """
+    accounts = list(accounts or ACCOUNTS)
+    ready = [a for a in accounts if api_key(a)]
+    for a in accounts:
+        if a not in ready:
+            print(f"{a}: нет API-ключа — пропуск")
+    if not ready:
+        raise RuntimeError("Нет ни одного кабинета с API-ключом")
+
+    frames: dict[str, pd.DataFrame] = {}
+    failed: dict[str, Exception] = {}
+    with ThreadPoolExecutor(max_workers=len(ready)) as pool:
+        futures = {a: pool.submit(_refresh_and_save, a, active_key(a), full) for a in ready}
+        for a, f in futures.items():
+            try:
+                frames[a], changed = f.result()
+            except Exception as e:
+                failed[a] = e
+                print(f"{a}: ОШИБКА — {e}")
+                continue
+            state = "обновлено" if changed else "без изменений"
+            print(f"{a}: активных поставок {len(frames[a])} ({state})")
+
+    if failed:
+        if errors is None:
+            raise RuntimeError(f"Не удалось обновить поставки кабинетов: {', '.join(failed)}")
+        errors.update(failed)
+    return frames
+
+
+if __name__ == "__main__":
+    # python supplies_fetch.py [A B ...] [--full]
+    try:
+        full = "--full" in sys.argv
+        run([a for a in sys.argv[1:] if a != "--full"] or None, full=full)
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        raise
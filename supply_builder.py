@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Поставки из закупленных заказов: закупленные/закупленные_{Регион}/{X}.xlsx.
+
+Берём строки с 'Закуплено' = 'да', создаём поставку и добавляем в неё
+задания пачками по BATCH_SIZE. Пачки уходят параллельно через одну сессию
+и лимитер кабинета; 429/5xx повторяются (wb_api.request). Если WB отклоняет
+пачку с 400/409, она делится пополам, пока не останутся отдельные плохие ID, —
+остальные задания всё равно попадают в поставку.
+"""
+import sys
+from collections import deque
+from datetime import datetime
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+import manifest
+from accounts import ACCOUNTS, api_key
+from antimerge_engine import stage_name as antimerge_stage
+from jobs import JobCancelled, cancel_requested, check_cancelled, current_job, progress
+from order_ids import format_report, parse_order_ids
+from regions import REGIONS, bought_key, supply_name_prefix, tasks_key
+from s3_storage import s3_list_keys, s3_read_frame, s3_read_frames, snapshot_key
+from wb_api import CONFLICT_COST, MARKETPLACE_URL, limiter_for, make_session, request
+
+BOUGHT_COL = "Закуплено"
+BOUGHT_YES = "да"
+
+ORDER_ID_COL = "id"
+
+BATCH_SIZE = 100
+MAX_WORKERS = 4
+# статусы, при которых пачку имеет смысл делить: виноваты отдельные ID
+SPLIT_STATUSES = {400, 409}
+# запросов на разбор одной отклонённой пачки; остаток после исчерпания — отклонён
+SPLIT_BUDGET = 96
+
+CREATE_SUPPLY_URL = f"{MARKETPLACE_URL}/api/v3/supplies"
+ADD_ORDERS_URL = f"{MARKETPLACE_URL}/api/marketplace/v3/supplies/{{supplyId}}/orders"
+
+
+def log(msg: str):
+    print(msg)
+
+
+def bought_ids(df) -> list[int]:
+    """ID заданий из строк с 'Закуплено' = 'да'."""
+    for col in (BOUGHT_COL, ORDER_ID_COL):
+        if col not in df.columns:
+            raise RuntimeError(f"В файле нет колонки '{col}'. Колонки: {list(df.columns)}")
+
+    df2 = df[df[BOUGHT_COL].astype(str).str.lower().str.strip() == BOUGHT_YES]
+
+    order_ids, report = parse_order_ids(df2[ORDER_ID_COL])
+    for line in format_report(report):
+        log(line)
+    return order_ids
+
+
+def read_bought_ids(key: str) -> list[int]:
+    try:
+        df = s3_read_frame(key)
+        log(f"OK: loaded {key} rows={len(df)}")
+    except Exception as e:
+        raise RuntimeError(f"Ошибка загрузки Excel из S3 ({key}): {e}")
+
+    return bought_ids(df)
+
+
+def create_supply(session, account: str, name: str) -> str:
+    # POST не идемпотентен: после таймаута поставка могла создаться, повтор дал бы дубль
+    create_resp = request(session, "POST", CREATE_SUPPLY_URL, account=account,
+                          json={"name": name}, timeout=60, idempotent=False)
+
+    if create_resp.status_code not in (200, 201):
+        raise RuntimeError(f"Ошибка при создании поставки: {create_resp.status_code} — {create_resp.text}")
+
+    supply_id = (create_resp.json() or {}).get("id")
+    if not supply_id:
+        raise RuntimeError(f"WB не вернул id поставки: {create_resp.text}")
+    return supply_id
+
+
+def _patch(session, account: str, supply_id: str, batch: list[int]) -> tuple[int | None, str]:
+    """Одна попытка добавить пачку. Возвращает (HTTP-статус или None при сетевой ошибке, причина)."""
+    try:
+        resp = request(session, "PATCH", ADD_ORDERS_URL.format(supplyId=supply_id), account=account,
+                       json={"orders": batch}, timeout=60)
+    except Exception as e:
+        return None, str(e)
+    if resp.status_code == 409:
+        limiter_for(account).charge(CONFLICT_COST - 1)
+    return resp.status_code, f"{resp.status_code} — {resp.text}"
+
+
+def _split(session, account: str, supply_id: str, batch: list[int],
+           status: int | None, reason: str) -> tuple[list[int], dict[int, str]]:
+    """
+    Разбирает отклонённую пачку пополам вплоть до отдельных ID, чтобы добавить все
+    валидные задания. Делится только на 400/409 (плохие ID внутри пачки); 401/403/404
+    и прочее относится ко всей пачке. Делим по уровням (в ширину) не больше
+    SPLIT_BUDGET запросов — что не успели разобрать, отклоняется с пометкой.
+    """
+    added: list[int] = []
+    rejected: dict[int, str] = {}
+    budget = SPLIT_BUDGET
+    pending = deque([(batch, status, reason)])
+    while pending:
+        part, status, reason = pending.popleft()
+        if status not in SPLIT_STATUSES or len(part) == 1:
+            rejected.update((oid, reason) for oid in part)
+            continue
+        if budget < 2:
+            rejected.update((oid, f"{reason} (пачка не разобрана: исчерпан лимит {SPLIT_BUDGET} запросов)")
+                            for oid in part)
+            continue
+        mid = len(part) // 2
+        for half in (part[:mid], part[mid:]):
+            s, r = _patch(session, account, supply_id, half)
+            budget -= 1
+            if s == 204:
+                added += half
+            else:
+                pending.append((half, s, r))
+    return added, rejected
+
+
+def _attach(session, account: str, supply_id: str, batch: list[int]) -> tuple[list[int], dict[int, str]]:
+    """Добавляет пачку; отклонённую разбирает через _split. Возвращает (добавленные, {id: причина})."""
+    status, reason = _patch(session, account, supply_id, batch)
+    if status == 204:
+        return batch, {}
+    return _split(session, account, supply_id, batch, status, reason)
+
+
+def attach_orders(session, account: str, supply_id: str, order_ids: list[int],
+                  batch_size: int = BATCH_SIZE, report=log, job=None) -> tuple[list[int], dict[int, str]]:
+    """
+    Добавляет все задания в поставку. Возвращает (добавленные, {id: причина отказа}).
+    report — куда писать прогресс по пачкам (None — молча, для запуска из потоков).
+    Если фоновую задачу отменили, оставшиеся пачки не отправляются.
+    job — фоновая задача, когда вызов идёт из рабочего потока (там current_job() пуст).
+    """
+    batches = [order_ids[i:i + batch_size] for i in range(0, len(order_ids), batch_size)]
+    added_all: list[int] = []
+    rejected_all: dict[int, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(batches)))) as pool:
+        futures = {pool.submit(_attach, session, account, supply_id, b): b for b in batches}
+        for done, f in enumerate(as_completed(futures), start=1):
+            batch = futures[f]
+            added, rejected = f.result()
+            added_all += added
+            rejected_all.update(rejected)
+            if report is not None:
+                if not rejected:
+                    report(f"✅ Добавлены {len(added)} заданий (итого {len(added_all)})")
+                else:
+                    report(f"⚠️ Пачка ({len(batch)}): добавлено {len(added)}, отклонено {len(rejected)}")
+            progress(done, len(futures))
+            check_cancelled(futures, job)
+    return added_all, rejected_all
+
+
+def run(region: str, account: str, key: str | None = None) -> str | None:
+    """Создаёт поставку региона для кабинета. Возвращает ID поставки (None — нечего добавлять)."""
+    if region not in REGIONS:
+        raise RuntimeError(f"Неизвестный регион: {region}")
+    token = api_key(account)
+    if not token:
+        raise RuntimeError(f"Missing API_{account} in st.secrets")
+
+    order_ids = read_bought_ids(key or bought_key(region, account))
+    if not order_ids:
+        log("Нет закупленных строк с валидными ID сборочных заданий.")
+        return None
+
+    log(f"Найдено заказов к добавлению: {len(order_ids)}")
+
+    session = make_session(token, pool_size=MAX_WORKERS)
+    supply_name = f"{supply_name_prefix(region)} {datetime.now().strftime('%Y-%m-%d')}"
+    supply_id = create_supply(session, account, supply_name)
+    log(f"Создана поставка '{supply_name}' с ID {supply_id}")
+
+    added, rejected = attach_orders(session, account, supply_id, order_ids)
+
+    for oid, reason in sorted(rejected.items()):
+        log(f"❌ {oid}: {reason}")
+    log(f"Готово. Поставка {supply_id}. Добавлено заданий: {len(added)}/{len(order_ids)}")
+    return supply_id
+
+
+def _build(session, region: str, account: str, order_ids: list[int], job=None) -> dict:
+    check_cancelled(job=job)
+    supply_name = f"{supply_name_prefix(region)} {datetime.now().strftime('%Y-%m-%d')}"
+    supply_id = create_supply(session, account, supply_name)
+    try:
+        added, rejected = attach_orders(session, account, supply_id, order_ids, report=None, job=job)
+    except JobCancelled:
+        return {"supply_id": supply_id, "name": supply_name,
+                "error": f"отменено — поставка {supply_id} создана, но заполнена не полностью"}
+    return {"supply_id": supply_id, "name": supply_name, "added": len(added), "rejected": rejected}
+
+
+def current_sheets(regions, existing: set[str]) -> dict[str, set[str]]:
+    """
+    {регион: листы закупленных из последнего ANTIMERGE региона}. ANTIMERGE не удаляет
+    листы групп, которых нет в новом ЗАДАНИЯ_*, — старые листы с 'да' дали бы поставки
+    по уже добавленным заданиям. Регион без манифеста пропускается с предупреждением.
+    """
+    sheets = {}
+    for r in regions:
+        if not any(k.startswith(REGIONS[r][1] + "/") for k in existing):
+            continue
+        m = manifest.load(antimerge_stage(r))
+        if not m:
+            log(f"⚠️ {r.upper()}: нет манифеста ANTIMERGE — запустите ANTIMERGE региона, регион пропущен")
+            continue
+        if m.get("inputs", {}).get(tasks_key(r)) != manifest.versions([tasks_key(r)]).get(tasks_key(r)):
+            log(f"⚠️ {r.upper()}: {tasks_key(r)} изменился после ANTIMERGE ({m.get('ts')}) — листы от прошлых заданий")
+        sheets[r] = set(m.get("outputs", []))
+    return sheets
+
+
+def run_all(regions=None, accounts=None) -> list[dict]:
+    """
+    Создаёт поставки по всем регионам × кабинетам, где есть закупленные строки.
+    Берутся только листы последнего ANTIMERGE региона (current_sheets).
+    Листы читаются одним пакетом, поставки создаются параллельно
+    (каждый кабинет — в пределах своего лимитера). В конце — общий отчёт.
+    """
+    regions = list(regions or REGIONS)
+    accounts = [a for a in (accounts or ACCOUNTS) if api_key(a)]
+    if not accounts:
+        raise RuntimeError("Нет ни одного кабинета с API-ключом")
+
+    existing = set(s3_list_keys("закупленные/"))
+    sheets = current_sheets(regions, existing)
+    pairs = [(r, a) for r in sheets for a in accounts
+             if bought_key(r, a) in sheets[r]
+             and (bought_key(r, a) in existing or snapshot_key(bought_key(r, a)) in existing)]
+    errors: dict[str, Exception] = {}
+    frames = s3_read_frames([bought_key(r, a) for r, a in pairs], errors=errors)
+
+    report: list[dict] = []
+    jobs = {}
+    for r, a in pairs:
+        key = bought_key(r, a)
+        row = {"region": r, "account": a, "key": key}
+        if key in errors:
+            row["error"] = f"Ошибка загрузки Excel из S3 ({key}): {errors[key]}"
+            report.append(row)
+            continue
+        try:
+            ids = bought_ids(frames[key])
+        except Exception as e:
+            row["error"] = str(e)
+            report.append(row)
+            continue
+        if ids:
+            row["total"] = len(ids)
+            jobs[(r, a)] = (row, ids)
+
+    if not jobs:
+        log("Нет закупленных строк ни в одном листе.")
+
+    sessions = {a: make_session(api_key(a), pool_size=MAX_WORKERS * len(regions))
+                for a in {a for _, a in jobs}}
+    # потоки пула не видят current_job(), поэтому задача передаётся в _build явно;
+    # при отмене ждём уже начатые поставки, чтобы их ID попали в отчёт
+    job = current_job()
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as pool:
+        futures = {pool.submit(_build, sessions[a], r, a, ids, job): row for (r, a), (row, ids) in jobs.items()}
+        for done, f in enumerate(as_completed(futures), start=1):
+            row = futures[f]
+            try:
+                row.update(f.result())
+            except (CancelledError, JobCancelled):
+                row["error"] = "отменено до создания поставки"
+            except Exception as e:
+                row["error"] = str(e)
+            report.append(row)
+            progress(done, len(futures))
+            if cancel_requested(job):
+                for p in futures:
+                    p.cancel()
+
+    report.sort(key=lambda x: (regions.index(x["region"]), x["account"]))
+    log("\n=== Итог по поставкам ===")
+    for row in report:
+        head = f"{row['region'].upper()} {row['account']}"
+        if "error" in row:
+            log(f"❌ {head}: {row['error']}")
+            continue
+        log(f"{'✅' if not row['rejected'] else '⚠️'} {head}: поставка {row['supply_id']} — "
+            f"добавлено {row['added']}/{row['total']}")
+        for oid, reason in sorted(row["rejected"].items()):
+            log(f"    ❌ {oid}: {reason}")
+
+    check_cancelled(job=job)
+    failed = [f"{x['region']}/{x['account']}" for x in report if "error" in x]
+    if failed:
+        raise RuntimeError(f"Не удалось создать поставки: {', '.join(failed)}")
+    return report
+
+
+if __name__ == "__main__":
+    # python supply_builder.py krd A  |  python supply_builder.py all
+    try:
+        if sys.argv[1:] == ["all"]:
+            run_all()
+        else:
+            run(sys.argv[1], sys.argv[2])
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        raise
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP-слой для marketplace-api.wildberries.ru: сессии с keep-alive
+и ограничение частоты запросов отдельно для каждого кабинета.
+"""
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MARKETPLACE_URL = "https://marketplace-api.wildberries.ru"
+CONTENT_URL = "https://content-api.wildberries.ru"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Лимит WB для методов сборочных заданий FBS: 300 запросов в минуту на продавца,
+# всплеск до 20 запросов. Ответ 409 засчитывается как 10 запросов.
+DEFAULT_RATE = 300 / 60
+DEFAULT_BURST = 20
+CONFLICT_COST = 10
+
+
+class RateLimiter:
+    """Token bucket: rate токенов в секунду, не больше burst в запасе. Потокобезопасен."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def charge(self, tokens: float):
+        """Списывает дополнительные токены (баланс может уйти в минус — все подождут)."""
+        with self._lock:
+            self._tokens -= tokens
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов для всех потоков минимум на seconds."""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(account: str, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST) -> RateLimiter:
+    """
+    Один лимитер на кабинет на процесс: параллельные задачи делят общую квоту.
+    rate/burst учитываются при первом обращении — для API с другой квотой берите свой ключ.
+    """
+    with _limiters_lock:
+        if account not in _limiters:
+            _limiters[account] = RateLimiter(rate, burst)
+        return _limiters[account]
+
+
+def make_session(api_key: str, pool_size: int = 10) -> requests.Session:
+    session = requests.Session()
+    session.headers.update({"Authorization": api_key})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+def _retry_delay(response, attempt: int, backoff: float) -> float:
+    # WB при 429 подсказывает паузу в заголовке X-Ratelimit-Retry (секунды)
+    if response is not None:
+        hint = response.headers.get("X-Ratelimit-Retry") or response.headers.get("Retry-After")
+        try:
+            return max(float(hint), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return backoff * (2 ** attempt) + random.uniform(0, backoff)
+
+
+def request(session: requests.Session, method: str, url: str, account: str | None = None,
+            retries: int = 3, backoff: float = 1.0, timeout: float = 30, idempotent: bool = True,
+            **kwargs) -> requests.Response:
+    """
+    Запрос с таймаутом и повтором на 429/5xx и сетевых ошибках (экспоненциальная пауза).
+    Если указан account — перед каждой попыткой берётся токен из лимитера кабинета.
+    idempotent=False (создание сущностей) — повтор только на 429: после таймаута или 5xx
+    WB мог запрос уже выполнить, и повтор создал бы дубль.
+    Возвращает последний ответ; сетевую ошибку последней попытки пробрасывает.
+    """
+    retry_statuses = RETRY_STATUSES if idempotent else {429}
+    for attempt in range(retries + 1):
+        if account:
+            limiter_for(account).acquire()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries or not idempotent:
+                raise
+            time.sleep(_retry_delay(None, attempt, backoff))
+            continue
+        if response.status_code not in retry_statuses or attempt == retries:
+            return response
+        delay = _retry_delay(response, attempt, backoff)
+        if account and response.status_code == 429:
+            # квота кабинета исчерпана — притормаживаем все потоки, а не только этот
+            limiter_for(account).pause(delay)
+        time.sleep(delay)
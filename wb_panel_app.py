@@ -2,19 +2,35 @@
 import sys
 import os
 import re
-import boto3
 import base64
 import requests
 import subprocess
-from io import BytesIO
+import threading
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
-from botocore.client import Config
 
 sys.path.append(os.path.dirname(__file__))
 
+import antimerge_engine
+import manifest
+import merge_engine
+import orders_fetch
+import stocks
+import supplies_fetch
+import supply_builder
+from accounts import ACCOUNTS, api_key as account_api_key, nobuy_key
+from jobs import active_job, get_job, run_callable, run_script, submit_job, submit_script
+from s3_storage import (
+    XLSX_CONTENT_TYPE,
+    s3_list_etags,
+    s3_presigned_url,
+    s3_read_frame,
+    s3_upload_fileobj,
+)
+from wb_api import MARKETPLACE_URL, make_session, request
+
 # === Автоматическая установка UTF-8 на Windows ===
 if os.name == "nt":  # если Windows
     try:
@@ -32,14 +48,6 @@ if os.name == "nt":  # если Windows
 
 
 
-API_A = st.secrets.get("API_A", "")
-API_B = st.secrets.get("API_B", "")
-API_C = st.secrets.get("API_C", "")
-API_D = st.secrets.get("API_D", "")
-API_E = st.secrets.get("API_E", "")
-API_F = st.secrets.get("API_F", "")
-
-
 # --- Простая авторизация ---
 #if "authenticated" not in st.session_state:
 #    st.session_state.authenticated = False
@@ -55,23 +63,26 @@ API_F = st.secrets.get("API_F", "")
 #            st.error("Неверный пароль")
 #    st.stop()
 
-def _s3():
-    return boto3.client(
-        "s3",
-        endpoint_url=st.secrets["YC_S3_ENDPOINT"],
-        aws_access_key_id=st.secrets["YC_S3_KEY_ID"],
-        aws_secret_access_key=st.secrets["YC_S3_SECRET"],
-        region_name=st.secrets.get("YC_S3_REGION", None),
-        config=Config(signature_version="s3v4"),
-    )
+# --- Настройки, клиенты и сессии живут между перезапусками скрипта (st.cache_resource) ---
+S3_ENV = ("YC_S3_ENDPOINT", "YC_S3_BUCKET", "YC_S3_KEY_ID", "YC_S3_SECRET", "YC_S3_REGION")
+
+
+@st.cache_resource(show_spinner=False)
+def panel_config() -> dict[str, str]:
+    """Разбирает st.secrets один раз: S3 — в окружение (для s3_storage), возвращает API-ключи кабинетов."""
+    for name in S3_ENV:
+        if name in st.secrets:
+            os.environ.setdefault(name, str(st.secrets[name]))
+    return {a: account_api_key(a) for a in ACCOUNTS}
+
+
+@st.cache_resource(show_spinner=False)
+def wb_session(account: str, key: str):
+    """keep-alive сессия к marketplace-api на кабинет; новый ключ — новая сессия."""
+    return make_session(key)
 
-def _s3_bucket():
-    return st.secrets["YC_S3_BUCKET"]
 
-def s3_read_excel(key: str) -> pd.DataFrame:
-    obj = _s3().get_object(Bucket=_s3_bucket(), Key=key)
-    data = obj["Body"].read()
-    return pd.read_excel(BytesIO(data))
+api_keys = panel_config()
 
 barcodes_to_log = []
 
@@ -93,6 +104,10 @@ people = {
 st.sidebar.header("👤 Кабинет")
 selected_person = st.sidebar.selectbox("Выберите кабинет:", list(people.keys()))
 person_id = people[selected_person]
+api_key = api_keys.get(person_id)
+
+# MERGE / ANTIMERGE / объединение с базой пропускают работу, если входы не менялись (manifest)
+force_rerun = st.sidebar.checkbox("♻️ Пересчитывать, даже если входы не менялись", key="force_rerun")
 
 
 # --- Хелперы и состояние для активных поставок ---
@@ -103,46 +118,101 @@ def _script_for(pid: str) -> str:
     return f"get_supply/get_supply_{pid}.py"
 
 def load_active_supplies_for(pid: str):
-    """Запускает скрипт кабинета (если есть) и возвращает DataFrame из S3 (или None)."""
+    """Обновляет поставки кабинета скриптом (если есть); при ошибке — последняя таблица из S3 (или None)."""
     script = _script_for(pid)
     s3_key = _excel_key_for(pid)
 
-    env = dict(os.environ)
-    env.update({
-        "YC_S3_ENDPOINT": str(st.secrets["YC_S3_ENDPOINT"]),
-        "YC_S3_BUCKET": str(st.secrets["YC_S3_BUCKET"]),
-        "YC_S3_KEY_ID": str(st.secrets["YC_S3_KEY_ID"]),
-        "YC_S3_SECRET": str(st.secrets["YC_S3_SECRET"]),
-        "YC_S3_REGION": str(st.secrets.get("YC_S3_REGION", "ru-central1")),
-        "WB_API_KEY": str(st.secrets.get(f"WB_API_{pid}", "")),
-        "ACTIVE_SUPPLIES_KEY": s3_key,
-    })
-
     if os.path.exists(script):
-        try:
-            r = subprocess.run(
-                [sys.executable, script],
-                capture_output=True,
-                text=True,
-                timeout=120,
-                env=env,
-            )
-            if r.returncode != 0:
-                st.sidebar.error(f"Ошибка get_supply_{pid}: {r.stderr or r.stdout}")
-        except Exception as ex:
-            st.sidebar.error(f"Ошибка запуска get_supply_{pid}: {ex}")
+        r = run_script(script, out_key=s3_key, timeout=120)
+        if r.ok and r.value is not None:
+            return r.value
+        if not r.ok:
+            st.sidebar.error(f"Ошибка get_supply_{pid}: {r.error}\n{r.log}")
 
     try:
-        return s3_read_excel(s3_key)
+        return s3_read_frame(s3_key)
     except Exception as ex:
         st.sidebar.warning(f"Не удалось прочитать active supplies из S3 для {pid}: {ex}")
         return None
 
 
+# --- НА_ЗАКУПКУ в orders/готовые: определены до кнопок, которые сбрасывают листинг ---
+READY_PREFIX = "orders/готовые/"
+
+# Листинг кэшируется на короткое время; ссылки — по (ключ, ETag), так что
+# заменённый файл сразу получает новую ссылку. Сами файлы браузер качает
+# из S3 по ссылке, через панель байты не идут.
+READY_LIST_TTL = 30
+DOWNLOAD_URL_TTL = 3600
+
+
+@st.cache_data(ttl=READY_LIST_TTL, show_spinner=False)
+def list_ready_files(prefix: str) -> list[tuple[str, str]]:
+    etags = s3_list_etags(prefix)
+    return sorted(
+        (k, etag) for k, etag in etags.items()
+        if os.path.basename(k).startswith("НА_ЗАКУПКУ_") and k.lower().endswith(".xlsx")
+    )
+
+
+@st.cache_data(ttl=DOWNLOAD_URL_TTL // 2, show_spinner=False)
+def download_url(key: str, etag: str) -> str:
+    return s3_presigned_url(key, expires=DOWNLOAD_URL_TTL, filename=os.path.basename(key))
+
+
 
 # Инициализация общего кэша
 if "active_supplies" not in st.session_state:
     st.session_state.active_supplies = {}  # dict: person_id -> DataFrame | None
+if "job_ids" not in st.session_state:
+    st.session_state.job_ids = []  # фоновые задачи этой вкладки (jobs.submit_*)
+
+
+# --- Фоновые задачи: кнопка ставит задачу в очередь, раздел ниже опрашивает её статус ---
+JOBS_POLL_SECONDS = 2
+JOB_ICONS = {"queued": "🕓", "running": "⏳", "done": "✅", "failed": "❌", "cancelled": "⛔"}
+
+
+def start_job(name: str, target, *args, **kwargs):
+    """target — путь к скрипту (.py) или функция. Та же задача, пока она идёт, второй раз не ставится."""
+    running = active_job(name)
+    if running is not None:
+        st.warning(f"«{name}» уже выполняется (задача {running.id}).")
+        return running
+    if isinstance(target, str):
+        job = submit_script(name, target, *args, owner=person_id, **kwargs)
+    else:
+        job = submit_job(name, target, *args, owner=person_id, **kwargs)
+    st.session_state.job_ids.append(job.id)
+    st.info(f"Задача {job.id} «{name}» поставлена в очередь — ход выполнения в разделе «Фоновые задачи».")
+    return job
+
+
+@st.fragment(run_every=JOBS_POLL_SECONDS)
+def jobs_section():
+    jobs_ = [j for j in (get_job(i) for i in st.session_state.job_ids) if j is not None]
+    if not jobs_:
+        return
+    st.subheader("⏳ Фоновые задачи")
+    for job in reversed(jobs_):
+        with st.expander(f"{JOB_ICONS.get(job.status, '')} {job.name} — {job.status} [{job.id}]",
+                         expanded=not job.finished):
+            if job.total:
+                st.progress(min(job.done / job.total, 1.0), text=f"{job.done}/{job.total}")
+            if job.result is not None and job.result.error:
+                st.error(job.result.error)
+            st.code(job.log or "…", language=None)
+            if not job.finished:
+                if job.cancel_requested:
+                    st.caption("Отмена запрошена — ждём завершения текущих запросов.")
+                elif st.button("⛔ Отменить", key=f"cancel_{job.id}"):
+                    job.cancel()
+            elif st.button("🧹 Убрать из списка", key=f"hide_{job.id}"):
+                st.session_state.job_ids.remove(job.id)
+                st.rerun(scope="fragment")
+
+
+jobs_section()
 
 #----------------------------------------КОНЕЦ САЙДБАР НАСТРОЙКИ------------------------------------------------------------------------------
 import sys
@@ -154,11 +224,17 @@ st.subheader("📥 Первичные действия")
 download_script = f"get_orders/get_orders_{person_id}.py"
 if st.button("📥 Скачать задания"):
     if os.path.exists(download_script):
-        result = subprocess.run([sys.executable, download_script], capture_output=True, text=True)
-        st.text_area("Результат скачивания", (result.stdout or '') + (result.stderr or ''), height=300)
+        result = run_script(download_script)
+        st.text_area("Результат скачивания", result.log, height=300)
     else:
         st.error(f"Скрипт {download_script} не найден.")
 
+if st.button("📥 Скачать задания по ВСЕМ кабинетам"):
+    result = run_callable(orders_fetch.run)
+    if not result.ok:
+        st.error(f"Ошибка скачивания: {result.error}")
+    st.text_area("Результат скачивания (все кабинеты)", result.log, height=300)
+
 #----------------------------------------------НЕ КУПИЛИ/СКРИПТ------------------------------------------------------------------------------
 
 nobuy_orders_script = f"get_orders_nobuy/get_orders_nobuy_{person_id}.py"
@@ -202,47 +278,19 @@ if st.button("📥 Получить заказы НЕ КУПИЛИ"):
         st.error(f"Скрипт {nobuy_orders_script} не найден.")
         st.stop()
 
-    # ВАЖНО: запускаем тем же интерпретатором, что и Streamlit
-    cmd = [sys.executable, nobuy_orders_script, *supply_ids]
-
-    # ВАЖНО: прокидываем env (как ты уже делаешь для get_supply) :contentReference[oaicite:1]{index=1}
-    env = dict(os.environ)
-    env.update({
-        "YC_S3_ENDPOINT": str(st.secrets["YC_S3_ENDPOINT"]),
-        "YC_S3_BUCKET": str(st.secrets["YC_S3_BUCKET"]),
-        "YC_S3_KEY_ID": str(st.secrets["YC_S3_KEY_ID"]),
-        "YC_S3_SECRET": str(st.secrets["YC_S3_SECRET"]),
-        "YC_S3_REGION": str(st.secrets.get("YC_S3_REGION", "ru-central1")),
-
-        # если в nobuy-скрипте нужен ключ WB:
-        "NOBUY_ORDERS_KEY": f"orders/Выходы A/поставки_не_купили_{person_id}.xlsx"
-    })
-
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            env=env,
-            timeout=180,
-        )
-    except subprocess.TimeoutExpired:
-        st.error("Скрипт выполнялся слишком долго и был остановлен (timeout).")
-        st.stop()
-    except Exception as ex:
-        st.error(f"Ошибка запуска subprocess: {ex}")
-        st.stop()
+    result = run_script(
+        nobuy_orders_script,
+        supply_ids,
+        out_key=nobuy_key(person_id),
+        timeout=180,
+    )
 
-    if result.returncode == 0:
+    if result.ok:
         st.success("Сбор заказов из 'НЕ КУПИЛИ' выполнен успешно.")
     else:
-        st.error(f"Ошибка при выполнении скрипта (код {result.returncode}).")
+        st.error(f"Ошибка при выполнении скрипта: {result.error}")
 
-    st.text_area(
-        "Логи",
-        (result.stdout or "") + ("\n" + result.stderr if result.stderr else ""),
-        height=300
-    )
+    st.text_area("Логи", result.log, height=300)
 #-----------------------------------------------НЕ КУПИЛИ КОНЕЦ------------------------------------------------------------------------------
 
 
@@ -250,11 +298,17 @@ if st.button("📥 Получить заказы НЕ КУПИЛИ"):
 merge_script = f"merge_with_base/merge_with_base_{person_id}.py"
 if st.button("🔗 Объединить с базой"):
     if os.path.exists(merge_script):
-        result = subprocess.run([sys.executable, merge_script], capture_output=True, text=True)
-        st.text_area("Результат скачивания", (result.stdout or '') + (result.stderr or ''), height=300)
+        result = run_script(merge_script, force=force_rerun)
+        st.text_area("Результат скачивания", result.log, height=300)
     else:
         st.error(f"Скрипт {merge_script} не найден.")
 
+if st.button("🔗 Объединить с базой ВСЕ кабинеты"):
+    result = run_callable(merge_engine.run, force=force_rerun)
+    if not result.ok:
+        st.error(f"Ошибка объединения: {result.error}")
+    st.text_area("Результат объединения (все кабинеты)", result.log, height=300)
+
 # --- Создать поставку (с вводом имени из Streamlit) ---
 # --- Первичные действия ---
 st.subheader("Создать поставку")
@@ -269,15 +323,12 @@ nobuy_orders_script = f"create_no_buy_supply/create_no_buy_supply_{person_id}.py
 if st.button("СОЗДАТЬ ПОСТАВКУ"):
     if os.path.exists(nobuy_orders_script):
         name_arg = (nobuy_supply_name or default_nobuy_name).strip()
-        result = subprocess.run(
-            ["python", nobuy_orders_script, name_arg],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0:
-            st.success(f"ID созданной поставки: {result.stdout.strip()}")
+        result = run_script(nobuy_orders_script, name_arg)
+        if result.ok:
+            st.success(f"ID созданной поставки: {result.value}")
         else:
             st.error("Ошибка при создании поставки")
-            st.text_area("Логи", (result.stdout or "") + (result.stderr or ""), height=300)
+            st.text_area("Логи", result.log, height=300)
     else:
         st.error(f"Скрипт {nobuy_orders_script} не найден.")
 
@@ -300,15 +351,13 @@ if st.button("🗑️ Удалить поставку"):
         st.error(f"Скрипт для удаления не найден: {delete_script_personal} или {delete_script_generic}")
     else:
         # Скрипт ожидает supplyId как 1-й аргумент и печатает 'OK' при 204 (см. delete_supply_булыга.py)
-        result = subprocess.run(["python", delete_script, sid], capture_output=True, text=True)
-        out = (result.stdout or "").strip()
-        err = (result.stderr or "").strip()
+        result = run_script(delete_script, sid)
 
-        if result.returncode == 0 and "OK" in out:
+        if result.ok and result.value:
             st.success(f"Поставка {sid} удалена.")
         else:
             st.error(f"Не удалось удалить поставку {sid}. См. лог ниже.")
-            st.text_area("Логи удаления", (out + ("\n" + err if err else "")) or "(пусто)", height=260)
+            st.text_area("Логи удаления", result.log.strip() or "(пусто)", height=260)
 
 
         
@@ -323,8 +372,9 @@ with col1:
     all_merge = "all_merge.py"
     if st.button("⚙️ MERGE (общий)"):
         if os.path.exists(all_merge):
-            result = subprocess.run([sys.executable, all_merge], capture_output=True, text=True)
-            st.text_area("Результат MERGE", (result.stdout or '') + (result.stderr or ''), height=300)
+            result = run_script(all_merge, force=force_rerun)
+            list_ready_files.clear()
+            st.text_area("Результат MERGE", result.log, height=300)
         else:
             st.error("Скрипт all_merge.py не найден.")
 
@@ -332,8 +382,8 @@ with col2:
     antimerge_krd = "antimerge_krasnodar.py"
     if st.button("❌ ANTIMMERGE (KRASNODAR)"):
         if os.path.exists(antimerge_krd):
-            result = subprocess.run([sys.executable, antimerge_krd], capture_output=True, text=True)
-            st.text_area("Результат ANTIMMERGE (KRASNODAR)", (result.stdout or '') + (result.stderr or ''), height=300)
+            result = run_script(antimerge_krd, force=force_rerun)
+            st.text_area("Результат ANTIMMERGE (KRASNODAR)", result.log, height=300)
         else:
             st.error("Скрипт antimerge_krasnodar.py не найден.")
 
@@ -341,8 +391,8 @@ with col3:
     antimerge_msk = "antimerge_moscow.py"
     if st.button("❌ ANTIMMERGE (MOSCOW)"):
         if os.path.exists(antimerge_msk):
-            result = subprocess.run([sys.executable, antimerge_msk], capture_output=True, text=True)
-            st.text_area("Результат ANTIMMERGE (MOSCOW)", (result.stdout or '') + (result.stderr or ''), height=300)
+            result = run_script(antimerge_msk, force=force_rerun)
+            st.text_area("Результат ANTIMMERGE (MOSCOW)", result.log, height=300)
         else:
             st.error("Скрипт antimerge_moscow.py не найден.")
 
@@ -350,8 +400,8 @@ with col4:
     antimerge_kal = "antimerge_kal.py"
     if st.button("❌ ANTIMMERGE (KAL)"):
         if os.path.exists(antimerge_kal):
-            result = subprocess.run([sys.executable, antimerge_kal], capture_output=True, text=True)
-            st.text_area("Результат ANTIMMERGE (KAL)", (result.stdout or '') + (result.stderr or ''), height=300)
+            result = run_script(antimerge_kal, force=force_rerun)
+            st.text_area("Результат ANTIMMERGE (KAL)", result.log, height=300)
         else:
             st.error("Скрипт antimerge_kal.py не найден.")
             
@@ -359,82 +409,52 @@ with col5:
     antimerge_ekb = "antimerge_ekb.py"
     if st.button("❌ ANTIMMERGE (EKB)"):
         if os.path.exists(antimerge_ekb):
-            result = subprocess.run([sys.executable, antimerge_ekb], capture_output=True, text=True)
-            st.text_area("Результат ANTIMMERGE (EKB)", (result.stdout or '') + (result.stderr or ''), height=300)
+            result = run_script(antimerge_ekb, force=force_rerun)
+            st.text_area("Результат ANTIMMERGE (EKB)", result.log, height=300)
         else:
             st.error("Скрипт antimerge_ekb.py не найден.")
 
-#------------------------------------------------------DOWNLOAD-------------------------------------------------------------------------------------
-# ---------- S3 helpers ----------
-def s3_list_keys(prefix: str) -> list[str]:
-    client = _s3()
-    bucket = _s3_bucket()
-    keys = []
-    token = None
-
-    while True:
-        kwargs = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": 1000}
-        if token:
-            kwargs["ContinuationToken"] = token
-
-        resp = client.list_objects_v2(**kwargs)
-        for obj in resp.get("Contents", []) or []:
-            k = obj.get("Key", "")
-            if k and not k.endswith("/"):
-                keys.append(k)
-
-        if resp.get("IsTruncated"):
-            token = resp.get("NextContinuationToken")
-        else:
-            break
-
-    return keys
-
-
-def s3_get_bytes(key: str) -> bytes:
-    obj = _s3().get_object(Bucket=_s3_bucket(), Key=key)
-    return obj["Body"].read()
-
-
-def s3_put_bytes(key: str, data: bytes, content_type: str):
-    _s3().put_object(
-        Bucket=_s3_bucket(),
-        Key=key,
-        Body=data,
-        ContentType=content_type,
-    )
+if st.button("🧭 Проверить актуальность выходов"):
+    result = run_callable(manifest.stale_stages)
+    if not result.ok:
+        st.error(f"Ошибка проверки: {result.error}")
+    elif not result.value:
+        st.success("Все записанные выходы актуальны.")
+    else:
+        for stage, changed in sorted(result.value.items()):
+            st.warning(f"Устарело '{stage}': изменились {', '.join(changed)}")
 
+if st.button("❌ ANTIMMERGE (все загруженные регионы)"):
+    result = run_callable(antimerge_engine.run, force=force_rerun)
+    if not result.ok:
+        st.error(f"Ошибка ANTIMMERGE: {result.error}")
+    st.text_area("Результат ANTIMMERGE (все регионы)", result.log, height=300)
 
+#------------------------------------------------------DOWNLOAD-------------------------------------------------------------------------------------
 st.markdown("---")
 st.subheader("📦 orders/готовые — скачать НА_ЗАКУПКУ и загрузить задания")
 
-READY_PREFIX = "orders/готовые/"
-
 st.markdown("### 1) Скачать файлы НА_ЗАКУПКУ_*.xlsx")
 
 try:
-    all_ready = s3_list_keys(READY_PREFIX)
-    zakupku_keys = [
-        k for k in all_ready
-        if os.path.basename(k).startswith("НА_ЗАКУПКУ_") and k.lower().endswith(".xlsx")
-    ]
+    zakupku = list_ready_files(READY_PREFIX)
 
-    if not zakupku_keys:
+    if not zakupku:
         st.info("В папке orders/готовые нет файлов НА_ЗАКУПКУ_*.xlsx")
     else:
-        for key in sorted(zakupku_keys):
+        for key, etag in zakupku:
             fname = os.path.basename(key)
 
-            data = s3_get_bytes(key)
-            st.download_button(
+            st.link_button(
                 label=f"⬇️ Скачать {fname}",
-                data=data,
-                file_name=fname,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                url=download_url(key, etag),
                 use_container_width=True,
-                key=f"dl_{key}",
             )
 
+    if st.button("🔄 Обновить список файлов", key="refresh_ready"):
+        list_ready_files.clear()
+        st.rerun()
+
 except Exception as ex:
     st.error(f"Ошибка чтения списка файлов из S3: {ex}")
 
@@ -464,14 +484,10 @@ if uploaded is not None:
     else:
         try:
             dest_key = f"{READY_PREFIX}{filename}"
-            file_bytes = uploaded.getvalue()
-
-            s3_put_bytes(
-                key=dest_key,
-                data=file_bytes,
-                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+            uploaded.seek(0)
+            s3_upload_fileobj(dest_key, uploaded, XLSX_CONTENT_TYPE)
 
+            list_ready_files.clear()
             st.success(f"✅ Загружено в S3: {dest_key}")
 
             st.rerun()
@@ -479,6 +495,13 @@ if uploaded is not None:
         except Exception as ex:
             st.error(f"Ошибка загрузки в S3: {ex}")
 
+#-----------------------------------------------ВСЕ ЗАКУПЛЕННЫЕ ПОСТАВКИ------------------------------------------------------------------------------
+st.markdown("---")
+st.subheader("🚚 Все закупленные поставки")
+
+if st.button("🚚 Создать поставки по ВСЕМ регионам и кабинетам"):
+    start_job("Поставки: все регионы и кабинеты", supply_builder.run_all)
+
 #-----------------------------------------------КРАСНОДАРСКИЕ ОПЕРАЦИИ------------------------------------------------------------------------------
 st.markdown("---")
 st.subheader("📄 FBS КРАСНОДАР")
@@ -491,8 +514,7 @@ for label, script_template in standard_actions.items():
     if st.button(label):
         script_name = script_template.format(person_id)
         if os.path.exists(script_name):
-            result = subprocess.run([sys.executable, script_name], capture_output=True, text=True)
-            st.text_area(f"Результат: {label}", (result.stdout or '') + (result.stderr or ''), height=300)
+            start_job(f"{label} ({person_id})", script_name)
         else:
             st.error(f"Скрипт {script_name} не найден.")
 
@@ -508,8 +530,7 @@ for label, script_template in moscow_actions.items():
     if st.button(label):
         script_name = script_template.format(person_id)
         if os.path.exists(script_name):
-            result = subprocess.run([sys.executable, script_name], capture_output=True, text=True)
-            st.text_area(f"Результат: {label}", (result.stdout or '') + (result.stderr or ''), height=300)
+            start_job(f"{label} ({person_id})", script_name)
         else:
             st.error(f"Скрипт {script_name} не найден.")
 
@@ -525,8 +546,7 @@ for label, script_template in moscow_actions.items():
     if st.button(label):
         script_name = script_template.format(person_id)
         if os.path.exists(script_name):
-            result = subprocess.run([sys.executable, script_name], capture_output=True, text=True)
-            st.text_area(f"Результат: {label}", (result.stdout or '') + (result.stderr or ''), height=300)
+            start_job(f"{label} ({person_id})", script_name)
         else:
             st.error(f"Скрипт {script_name} не найден.")
 
@@ -542,8 +562,7 @@ for label, script_template in moscow_actions.items():
     if st.button(label):
         script_name = script_template.format(person_id)
         if os.path.exists(script_name):
-            result = subprocess.run([sys.executable, script_name], capture_output=True, text=True)
-            st.text_area(f"Результат: {label}", (result.stdout or '') + (result.stderr or ''), height=300)
+            start_job(f"{label} ({person_id})", script_name)
         else:
             st.error(f"Скрипт {script_name} не найден.")
 
@@ -557,65 +576,32 @@ if st.button("⚙️ Запустить обработку листов подб
     if not os.path.exists(process_script):
         st.error(f"Скрипт не найден: {process_script}")
     else:
-        try:
-            result = subprocess.run(
-                [sys.executable, process_script],
-                capture_output=True,
-                text=True
-            )
-
-            if result.returncode == 0:
-                st.success("Обработка завершена успешно.")
-                st.text_area("Лог обработки", (result.stdout or "") + (result.stderr or ""), height=250)
-            else:
-                st.error("Во время обработки возникли ошибки.")
-                st.text_area("Лог обработки", (result.stdout or "") + (result.stderr or ""), height=250)
+        result = run_script(process_script)
 
-        except Exception as ex:
-            st.error(f"Ошибка при запуске скрипта: {ex}")
+        if result.ok:
+            st.success("Обработка завершена успешно.")
+        else:
+            st.error("Во время обработки возникли ошибки.")
+        st.text_area("Лог обработки", result.log, height=250)
 
 #-----------------------------------------------СРОК ГОДНОСТИ------------------------------------------------------------------------------
-# Словарь с API-ключами по кабинетам
-api_keys = {
-    "A": API_A,
-    "B": API_B,
-    "C": API_C,
-    "D": API_D,
-    "E": API_E,
-    "F": API_F
-}
 st.markdown("---")
 st.subheader("⌛ Закрепить сроки годности (FBS)")
 
-if st.button("📌 Отправить сроки годности в WB"):
-    api_key = api_keys.get(person_id)
+retry_failed_exp = st.checkbox(
+    "🔁 Только неудачные (409/ошибки из журнала)",
+    key="exp_retry_failed",
+)
 
+if st.button("📌 Отправить сроки годности в WB"):
     if not api_key:
         st.error("Не найден API-ключ для выбранной группы.")
     else:
-        try:
-            import sys, os
-            sys.path.append(os.path.join(os.path.dirname(__file__), "list_podbor"))
-
-            from set_experation import run   # <-- если файл называется set_expiration.py — замените тут
-
-            import io
-            buf = io.StringIO()
-
-            # перехват stdout, чтобы показать лог в интерфейсе
-            import sys
-            old_out = sys.stdout
-            sys.stdout = buf
-
-            run(api_key)
-
-            sys.stdout = old_out
-
-            st.success("Обработка завершена.")
-            st.text_area("Лог выполнения", buf.getvalue(), height=300)
-
-        except Exception as ex:
-            st.error(f"Ошибка выполнения: {ex}")
+        # фоновая задача: лог перехватывается только для её потока, глобальный stdout не трогаем
+        start_job(
+            f"Сроки годности ({person_id})", "list_podbor/set_experation.py", api_key,
+            account=person_id, retry_failed=retry_failed_exp,
+        )
 
 
 
@@ -691,12 +677,16 @@ if st.button("🚫 Перенести выбранную группу в НЕ К
 
 # Кнопка под выбором кабинета: обновить сразу все кабинеты
 if st.sidebar.button("🔄 Обновить активные поставки по ВСЕМ кабинетам"):
-    updated = 0
-    for pid in people.values():
-        df_all = load_active_supplies_for(pid)
-        st.session_state.active_supplies[pid] = df_all
-        updated += 1
-    st.sidebar.success(f"Обновлено таблиц: {updated}")
+    # все кабинеты разом, таблицы — прямо из результата; в S3 они только сохраняются
+    errors: dict[str, Exception] = {}
+    result = run_callable(supplies_fetch.run, list(people.values()), errors=errors, timeout=120)
+    if result.ok:
+        st.session_state.active_supplies.update(result.value)
+        st.sidebar.success(f"Обновлено таблиц: {len(result.value)}")
+    else:
+        st.sidebar.error(f"Ошибка обновления поставок: {result.error}")
+    for pid, err in errors.items():
+        st.sidebar.error(f"Ошибка get_supply_{pid}: {err}")
 
 # Отдельная кнопка: обновить выбранный кабинет
 colA, colB = st.columns([1, 2])
@@ -722,29 +712,15 @@ st.subheader("🚚 Передать поставку в доставку")
 # Ввод ID поставки
 deliver_supply_id = st.text_input("Введите ID поставки для передачи в доставку")
 
-# Словарь с API-ключами по кабинетам
-api_keys = {
-    "A": API_A,
-    "B": API_B,
-    "C": API_C,
-    "D": API_D,
-    "E": API_E,
-    "F": API_F
-}
-
-
-api_key = api_keys.get(person_id)
-
 if st.button("🚚 Передать выбранную поставку в доставку"):
     if not deliver_supply_id.strip():
         st.error("Введите ID поставки.")
     elif not api_key:
         st.error(f"Не найден API-ключ для кабинета: {person_id}")
     else:
-        url = f"https://marketplace-api.wildberries.ru/api/v3/supplies/{deliver_supply_id.strip()}/deliver"
-        headers = {"Authorization": api_key}
+        url = f"{MARKETPLACE_URL}/api/v3/supplies/{deliver_supply_id.strip()}/deliver"
         try:
-            response = requests.patch(url, headers=headers)
+            response = request(wb_session(person_id, api_key), "PATCH", url, account=person_id)
             response.raise_for_status()
             st.success(f"Поставка {deliver_supply_id.strip()} успешно передана в доставку.")
         except requests.HTTPError as e:
@@ -773,12 +749,11 @@ if st.button("📥 Получить QR-код"):
     elif not api_key:
         st.error(f"Не найден API-ключ для кабинета: {person_id}")
     else:
-        url = f"https://marketplace-api.wildberries.ru/api/v3/supplies/{barcode_supply_id.strip()}/barcode"
-        headers = {"Authorization": api_key}
+        url = f"{MARKETPLACE_URL}/api/v3/supplies/{barcode_supply_id.strip()}/barcode"
         params = {"type": barcode_type}
 
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = request(wb_session(person_id, api_key), "GET", url, account=person_id, params=params)
             response.raise_for_status()
             data = response.json()
 
@@ -823,8 +798,7 @@ warehouses_by_group = {
     "ГРУППА G": {"КРД": "", "ЗЕЛ": "", "МСК": "", "ЕКБ": ""},
 }
 
-# Путь к файлу базы и лога
-db_path = r"D:/Софт/База данных/База данных.xlsx"
+# Лог успешных обновлений (баркоды берутся из базы в S3 через индекс stocks/product_db)
 log_file = r"D:/Софт/скрипты и аутпутс/Остатки/остатки_логи.xlsx"
 
 # Вводы
@@ -839,125 +813,130 @@ warehouse_name = st.selectbox(
 )
 warehouse_id2 = warehouses_for_group.get(warehouse_name)
 
-def _chunked(lst, n=1000):
-    for i in range(0, len(lst), n):
-        yield lst[i:i+n]
+
+@st.cache_resource(show_spinner=False)
+def stock_log_lock() -> threading.Lock:
+    # один замок на процесс: скрипт панели перезапускается, а фоновые задачи пишут лог параллельно
+    return threading.Lock()
+
+
+def append_stock_log(report: pd.DataFrame, source: str):
+    """
+    Дописывает в лог остатков успешные баркоды отчёта stocks.run — строка на склад.
+    source — откуда обновление (артикул из поля, имя таблицы, обнуление склада).
+    Чтение-дописывание-запись идут под общим замком, файл подменяется целиком (os.replace).
+    """
+    ok = report[report["Статус"] == "ok"]
+    if ok.empty:
+        return
+    names = {wid: name for name, wid in warehouses_for_group.items() if wid}
+    log_entry = pd.DataFrame([{
+        "Дата и время": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "Группа": selected_person,
+        "Артикул продавца": ", ".join(sorted(set(part[stocks.ARTICLE_COL]) - {""})),
+        "Источник": source,
+        "Баркоды": ", ".join(part["Баркод"]),
+        "Склад": names.get(wid, wid),
+        "ID склада": wid,
+        "Остаток": ", ".join(map(str, sorted(part[stocks.AMOUNT_COL].unique()))),
+    } for wid, part in ok.groupby(stocks.WAREHOUSE_COL)])
+
+    with stock_log_lock():
+        if os.path.exists(log_file):
+            log_entry = pd.concat([pd.read_excel(log_file), log_entry], ignore_index=True)
+        else:
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        tmp = f"{os.path.splitext(log_file)[0]}.{threading.get_ident()}.tmp.xlsx"
+        log_entry.to_excel(tmp, index=False)
+        os.replace(tmp, log_file)
+
+
+def show_stock_report(report: pd.DataFrame):
+    st.markdown("### Итоги")
+    st.write(f"Успешно: {(report['Статус'] == 'ok').sum()} шт.")
+    st.write(f"Не удалось: {(report['Статус'] != 'ok').sum()} шт.")
+    failed = report[report["Статус"] != "ok"]
+    if not failed.empty:
+        st.dataframe(failed, use_container_width=True)
+
 
 if st.button("🔄 Найти баркоды и обновить остатки"):
     # Базовые проверки
-    if not db_path.strip() or not article_input.strip() or not amount_input2.strip() or not warehouse_id2:
+    if not article_input.strip() or not amount_input2.strip() or not warehouse_id2:
         st.error("Пожалуйста, заполните все поля.")
-    elif not os.path.exists(db_path):
-        st.error("Файл базы данных не найден.")
     elif not api_key:
         st.error(f"Не найден API-ключ для кабинета: {person_id}")
     else:
-        try:
-            amount = int(amount_input2)
-        except ValueError:
-            st.error("Количество должно быть целым числом.")
-            st.stop()
-
-        if amount < 0:
-            st.error("Остаток не может быть отрицательным.")
-            st.stop()
-
-        try:
-            # Загружаем базу
-            df_base = pd.read_excel(db_path, header=0)
-        except Exception as ex:
-            st.error(f"Не удалось прочитать базу: {ex}")
-            st.stop()
-
-        # Проверяем колонки
-        if not {"Артикул продавца", "Баркод"}.issubset(df_base.columns):
-            st.error("В базе должны быть колонки 'Артикул продавца' и 'Баркод'.")
-            st.stop()
-
-        # Фильтруем по артикулу
-        rows = df_base.loc[df_base["Артикул продавца"].astype(str).str.strip() == article_input.strip()]
-        if rows.empty:
-            st.error("Артикул не найден в базе данных.")
-            st.stop()
-
-        sku_list = rows["Баркод"].astype(str).str.strip().dropna().unique().tolist()
-        st.write(f"Найдены баркоды ({len(sku_list)}): {sku_list}")
-
-        url = f"https://marketplace-api.wildberries.ru/api/v3/stocks/{warehouse_id2}"
-        headers = {"Content-Type": "application/json", "Authorization": api_key}
-
-        success_skus_all = []
-        error_skus_all = []
-
-        # Отправляем пачками по 1000
-        for idx, part in enumerate(_chunked(sku_list, 1000), start=1):
-            body = {"stocks": [{"sku": sku, "amount": amount} for sku in part]}
+        rows = pd.DataFrame([{
+            stocks.ITEM_COL: article_input.strip(),
+            stocks.WAREHOUSE_COL: warehouse_id2,
+            stocks.AMOUNT_COL: amount_input2.strip(),
+        }])
+        result = run_callable(stocks.run, person_id, rows, session=wb_session(person_id, api_key))
+        st.text_area("Лог обновления остатков", result.log, height=200)
+        if not result.ok:
+            st.error(f"Ошибка обновления остатков: {result.error}")
+        else:
+            show_stock_report(result.value)
             try:
-                response = requests.put(url, headers=headers, json=body, timeout=30)
+                append_stock_log(result.value, article_input.strip())
+                st.info(f"Лог записан: {log_file}")
             except Exception as ex:
-                st.error(f"[Пачка {idx}] Сетевая ошибка: {ex}")
-                error_skus_all.extend(part)
-                continue
+                st.warning(f"Не удалось записать лог: {ex}")
 
-            if response.status_code == 204:
-                st.success(f"[Пачка {idx}] ✅ Обновлён остаток {amount} для {len(part)} SKU.")
-                success_skus_all.extend(part)
-            else:
-                # Пытаемся выделить SKU с ошибкой из тела (чаще при 409)
-                try:
-                    data = response.json()
-                except Exception:
-                    data = {}
+# --- Массово: таблица (артикул или баркод, склад, остаток) ---
+st.markdown("#### 📦 Массовое обновление остатков по таблице")
+st.caption(
+    f"Колонки: «{stocks.ITEM_COL}», «{stocks.WAREHOUSE_COL}» (название склада группы или ID), "
+    f"«{stocks.AMOUNT_COL}». Баркоды по складам уходят пачками по {stocks.CHUNK_SIZE}, склады — параллельно."
+)
 
-                bad = []
-                if response.status_code == 409:
-                    try:
-                        bad = [item["sku"] for item in data.get("data", []) if "sku" in item]
-                    except Exception:
-                        bad = []
-
-                if bad:
-                    ok = [sku for sku in part if sku not in bad]
-                    if ok:
-                        st.success(f"[Пачка {idx}] Частично успешно: {len(ok)} SKU.")
-                    st.error(f"[Пачка {idx}] ⚠️ Ошибка 409. Не обновлено: {bad}")
-                    success_skus_all.extend(ok)
-                    error_skus_all.extend(bad)
-                else:
-                    st.error(f"[Пачка {idx}] ⚠️ Ошибка {response.status_code}: {response.text}")
-                    error_skus_all.extend(part)
+stock_file = st.file_uploader("Таблица остатков (.xlsx)", type=["xlsx"], key="stock_table")
+zero_all = st.checkbox(
+    "0️⃣ Обнулить весь ассортимент кабинета на выбранном складе (таблица не нужна)",
+    key="stock_zero_all",
+    help="Баркоды берутся из карточек выбранного кабинета (Content API), чужие товары не отправляются.",
+)
 
-        # Итог
-        st.markdown("### Итоги")
-        st.write(f"Успешно: {len(success_skus_all)} шт.")
-        st.write(f"Не удалось: {len(error_skus_all)} шт.")
 
-        # Лог только успешных
-        if success_skus_all:
-            try:
-                log_entry = pd.DataFrame([{
-                    "Дата и время": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "Группа": selected_person,
-                    "Артикул продавца": article_input.strip(),
-                    "Баркоды": ", ".join(success_skus_all),
-                    "Склад": warehouse_name,
-                    "ID склада": warehouse_id2,
-                    "Остаток": amount
-                }])
-
-                if not os.path.exists(log_file):
-                    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-                    log_entry.to_excel(log_file, index=False)
-                else:
-                    existing_log = pd.read_excel(log_file)
-                    pd.concat([existing_log, log_entry], ignore_index=True).to_excel(log_file, index=False)
+def zero_stock_update(account: str, warehouse_id: str, session, source: str):
+    # ассортимент кабинета (карточки) читается уже в фоновой задаче
+    report = stocks.zero_warehouse(account, warehouse_id, session=session)
+    append_stock_log(report, source)
+    print(f"Лог записан: {log_file}")
+    return report
 
-                st.info(f"Лог записан: {log_file}")
-            except Exception as ex:
-                st.warning(f"Не удалось записать лог: {ex}")
 
-        if not success_skus_all and error_skus_all:
-            st.warning("Все позиции вернулись с ошибкой — проверьте артикул/базу/анкеты товара/разрешения на склад.")
+def bulk_stock_update(account: str, rows: pd.DataFrame, warehouses: dict[str, str], session, source: str):
+    report = stocks.run(account, rows, warehouses, session=session)
+    append_stock_log(report, source)
+    print(f"Лог записан: {log_file}")
+    return report
+
+
+if st.button("🚀 Обновить остатки по таблице"):
+    if not api_key:
+        st.error(f"Не найден API-ключ для кабинета: {person_id}")
+    elif zero_all and not warehouse_id2:
+        st.error("Выберите склад с заполненным ID.")
+    elif not zero_all and stock_file is None:
+        st.error("Загрузите таблицу остатков.")
+    elif zero_all:
+        start_job(
+            f"Остатки ({person_id})", zero_stock_update, person_id, warehouse_id2,
+            wb_session(person_id, api_key), f"обнуление склада {warehouse_name}",
+        )
+    else:
+        try:
+            rows = pd.read_excel(stock_file, dtype={stocks.ITEM_COL: str, stocks.WAREHOUSE_COL: str})
+        except Exception as ex:
+            st.error(f"Не удалось прочитать таблицу: {ex}")
+            st.stop()
+        start_job(
+            f"Остатки ({person_id})", bulk_stock_update, person_id, rows,
+            {k: v for k, v in warehouses_for_group.items() if v},
+            wb_session(person_id, api_key), stock_file.name,
+        )
 
 #-----------------------------------------------УДАЛЕНИЕ ТАБЛИЦ В ПОСТАВКАХ------------------------------------------------------------------------------
 
@@ -987,19 +966,10 @@ if st.sidebar.button("🗑️ Удалить все .xlsx из папки Спи
             st.sidebar.success(f"Удалено файлов: {deleted_count}")
 
 if st.sidebar.button("🚀 Запустить обработку"):
-    try:
-        # Запускаем ваш готовый скрипт (например highlight_three.py)
-        # sys.executable гарантирует запуск тем же интерпретатором, что и streamlit
-        result = subprocess.run(
-            [sys.executable, "подсветка.py"],
-            capture_output=True,
-            text=True
-        )
+    result = run_script("подсветка.py")
+    if result.ok:
         st.success("Скрипт выполнен!")
-        st.code(result.stdout)
-        if result.stderr:
-            st.error("Ошибки во время выполнения:")
-            st.code(result.stderr)
-    except Exception as e:
-        st.error(f"Ошибка запуска: {e}")
+    else:
+        st.error(f"Ошибки во время выполнения: {result.error}")
+    st.code(result.log)
 
@@ -91,7 +91,7 @@ def process_file(path):
     print(f"  ✅ Готово. Подсвечено строк: {colored}")
 
 
-def main():
+def run():
     for file in FILES:
         try:
             process_file(file)
@@ -100,4 +100,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    run()